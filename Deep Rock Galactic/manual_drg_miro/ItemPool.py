@@ -0,0 +1,143 @@
+from collections import deque
+from collections.abc import MutableSequence
+from typing import TYPE_CHECKING, Iterable, Optional
+from BaseClasses import Item
+
+if TYPE_CHECKING:
+    from . import ManualWorld
+
+class ItemPool(MutableSequence):
+    """The item pool of a world while it is created, passed to the create_items hooks.
+    It can be used like a list, and also indexes its items by name, so taking an item out by name doesn't scan the pool.
+    Taken items leave a hole in place, the holes are only closed when an item is next read or written by position."""
+
+    def __init__(self, world: "ManualWorld", items: Iterable[Item] = ()):
+        self.world = world
+        self.items: list[Optional[Item]] = list(items)
+        self.length = len(self.items)
+        self.holes = 0
+        self.positions: Optional[dict[str, deque[int]]] = None  # by name, in pool order, built on the first take
+
+    def take(self, name: str) -> Item:
+        """Removes and returns the first item of the pool with this name."""
+        positions = self.get_positions().get(name)
+        if not positions:
+            raise KeyError(f"{name} is not in the item pool of player {self.world.player}.")
+        return self.take_at(positions.popleft())
+
+    def take_many(self, names: Iterable[str]) -> list[Item]:
+        """Takes an item for every name, a name listed several times takes as many copies."""
+        return [self.take(name) for name in names]
+
+    def precollect(self, names: Iterable[str]) -> list[Item]:
+        """Takes an item for every name and pushes it to the starting inventory of the player."""
+        items = self.take_many(names)
+        for item in items:
+            self.world.multiworld.push_precollected(item)
+        return items
+
+    def remove_category(self, category: str) -> list[Item]:
+        """Removes and returns every item of the pool in this category."""
+        positions = self.get_positions()
+        removed = []
+        for name in self.world.item_name_groups.get(category, []):
+            for position in positions.pop(name, ()):
+                removed.append(self.take_at(position))
+        return removed
+
+    def take_at(self, position: int) -> Item:
+        item = self.items[position]
+        self.items[position] = None
+        self.holes += 1
+        self.length -= 1
+        return item
+
+    def get_positions(self) -> dict[str, deque[int]]:
+        if self.positions is None:
+            self.positions = {}
+            for position, item in enumerate(self.items):
+                if item is not None:
+                    self.positions.setdefault(item.name, deque()).append(position)
+        return self.positions
+
+    def close_holes(self):
+        if self.holes:
+            self.items = [item for item in self.items if item is not None]
+            self.holes = 0
+            self.positions = None
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        return (item for item in self.items if item is not None)
+
+    def __getitem__(self, index):
+        self.close_holes()
+        return self.items[index]
+
+    def __setitem__(self, index, value):
+        self.close_holes()
+        self.items[index] = value
+        self.length = len(self.items)
+        self.positions = None
+
+    def __delitem__(self, index):
+        self.close_holes()
+        del self.items[index]
+        self.length = len(self.items)
+        self.positions = None
+
+    def insert(self, index: int, item: Item):
+        self.close_holes()
+        self.items.insert(index, item)
+        self.length += 1
+        self.positions = None
+
+    def append(self, item: Item):
+        if self.positions is not None:
+            self.positions.setdefault(item.name, deque()).append(len(self.items))
+        self.items.append(item)
+        self.length += 1
+
+    def extend(self, items: Iterable[Item]):
+        for item in list(items):
+            self.append(item)
+
+    def remove(self, item: Item):
+        """Removes the first item equal to this one, like list.remove, found through the name index."""
+        positions = self.get_positions().get(item.name, ())
+        for index, position in enumerate(positions):
+            if self.items[position] == item:
+                del positions[index]
+                self.take_at(position)
+                return
+        raise ValueError(f"{item} is not in the item pool of player {self.world.player}.")
+
+    def __contains__(self, item) -> bool:
+        return any(self.items[position] == item for position in self.get_positions().get(getattr(item, "name", None), ()))
+
+    def sort(self, *, key=None, reverse: bool = False):
+        self.close_holes()
+        self.items.sort(key=key, reverse=reverse)
+        self.positions = None
+
+    def clear(self):
+        self.items = []
+        self.length = 0
+        self.holes = 0
+        self.positions = None
+
+    def copy(self) -> list[Item]:
+        return list(self)
+
+    def __add__(self, other: Iterable[Item]) -> list[Item]:
+        return list(self) + list(other)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ItemPool, list)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ItemPool({list(self)!r})"
@@ -1,6 +1,7 @@
 from BaseClasses import Location
 from .Data import location_table
 from .Game import starting_index
+from .Items import item_name_to_item, item_name_groups
 from .hooks.Locations import before_location_table_processed
 
 location_table = before_location_table_processed(location_table)
@@ -52,6 +53,31 @@ for item in location_table:
 # location_id_to_name[None] = "__Manual Game Complete__"
 location_name_to_id = {name: id for id, name in location_id_to_name.items()}
 
+######################
+# Item placement plan
+######################
+
+def get_category_item_names(categories: list[str]) -> frozenset[str]:
+    """The names of the items in any of these categories, for the place_item_category and dont_place_item_category of the locations"""
+    return frozenset(name for c in categories for name in item_name_groups.get(c, []))
+
+# The names of the items each location with dont_place_item(_category) forbids, see ManualWorld.generate_basic.
+# An empty dont_place_item or dont_place_item_category list leaves the location without any forbidden item.
+location_name_to_forbidden_items: dict[str, frozenset[str]] = {}
+# The locations with place_item(_category), by name
+placement_location_names: set[str] = set()
+
+for location in location_table:
+    if "dont_place_item" in location or "dont_place_item_category" in location:
+        if location.get("dont_place_item", True) and location.get("dont_place_item_category", True):
+            forbidden_items = frozenset(name for name in location.get("dont_place_item", []) if name in item_name_to_item)
+            forbidden_items |= get_category_item_names(location.get("dont_place_item_category", []))
+            if forbidden_items:
+                location_name_to_forbidden_items[location["name"]] = forbidden_items
+
+    if "place_item" in location or "place_item_category" in location:
+        placement_location_names.add(location["name"])
+
 ######################
 # Location classes
 ######################
@@ -1,27 +1,29 @@
 from base64 import b64encode
+from collections import Counter
 import logging
 import os
 import json
-from typing import Callable, Optional
+from typing import Callable, Iterable, Optional
 
 import Utils
-from worlds.generic.Rules import forbid_items_for_player
 from worlds.LauncherComponents import Component, SuffixIdentifier, components, Type, launch_subprocess
 
 from .Data import item_table, location_table, region_table, category_table, meta_table
 from .Game import game_name, filler_item_name, starting_items
-from .Meta import world_description, world_webworld, enable_region_diagram
-from .Locations import location_id_to_name, location_name_to_id, location_name_to_location, location_name_groups, victory_names
-from .Items import item_id_to_name, item_name_to_id, item_name_to_item, item_name_groups
+from .Meta import world_description, world_webworld, enable_region_diagram, enable_progression_demotion
+from .Locations import location_id_to_name, location_name_to_id, location_name_to_location, location_name_groups, victory_names, \
+    location_name_to_forbidden_items, placement_location_names, get_category_item_names
+from .Items import item_id_to_name, item_name_to_id, item_name_to_item, item_name_groups, item_name_to_category_keys, item_name_to_value_weights, item_name_to_classification, progression_count_key, state_version_key, get_state_versions
 from .DataValidation import runGenerationDataValidation, runPreFillDataValidation
 
 from .Regions import create_regions
 from .Items import ManualItem
-from .Rules import set_rules
+from .ItemPool import ItemPool
+from .Rules import ForbiddenItemsRule, set_rules
 from .Options import manual_options_data
 from .Helpers import is_option_enabled, is_item_enabled, get_option_value
 
-from BaseClasses import ItemClassification, Tutorial, Item
+from BaseClasses import ItemClassification, Tutorial, Item, CollectionState
 from Options import PerGameCommonOptions
 from worlds.AutoWorld import World, WebWorld
 
@@ -34,6 +36,10 @@ from .hooks.World import \
     before_fill_slot_data, after_fill_slot_data, before_write_spoiler
 from .hooks.Data import hook_interpret_slot_data
 
+# the create_item hooks marked @passthrough, as in the template, only return their argument, so they aren't called for every item
+before_create_item_used = not getattr(before_create_item, "passthrough", False)
+after_create_item_used = not getattr(after_create_item, "passthrough", False)
+
 class ManualWorld(World):
     __doc__ = world_description
     game: str = game_name
@@ -53,8 +59,14 @@ class ManualWorld(World):
     item_name_to_item = item_name_to_item
     item_name_groups = item_name_groups
 
-    item_counts = {}
+    item_counts = {} # player -> Counter of the player's items by name, see get_item_counts
     start_inventory = {}
+    rule_compiler = None # the RuleCompiler of the world's requires, see Rules.set_rules
+    rule_profiler = None # the RuleProfiler of the world when enable_rule_profiler is set in meta.json, see Rules.set_rules
+    shadow_rules = None # the ShadowRules of the world when enable_shadow_rules is set in meta.json, see Rules.set_rules
+    batch_rules = None # the BatchRules of the world when enable_batch_rules is set in meta.json, see Rules.set_rules
+    demoted_items = {} # item name -> how many of it were demoted from progression to useful, see demote_unobserved_progression
+    dependency_index = {} # item name -> the rule version keys to drop when it is collected or removed, see Rules.set_rules
 
     location_id_to_name = location_id_to_name
     location_name_to_id = location_name_to_id
@@ -96,8 +108,8 @@ class ManualWorld(World):
         after_create_regions(self, self.multiworld, self.player)
 
     def create_items(self):
-        # Generate item pool
-        pool = []
+        # Generate item pool, indexed by item name for the hooks and the starting items below
+        pool = ItemPool(self)
         traps = []
         configured_item_names = self.item_id_to_name.copy()
 
@@ -117,9 +129,7 @@ class ManualWorld(World):
 
             if item_count == 0: continue
 
-            for i in range(item_count):
-                new_item = self.create_item(name)
-                pool.append(new_item)
+            pool.extend(self.create_item_copies(name, item_count))
 
             if item.get("early"): # only early
                 self.multiworld.early_items[self.player][name] = item_count
@@ -128,6 +138,8 @@ class ManualWorld(World):
                     self.options.local_items.value.add(name)
 
         pool = before_create_items_starting(pool, self, self.multiworld, self.player)
+        if not isinstance(pool, ItemPool): # the hook may return a list of its own
+            pool = ItemPool(self, pool)
 
         items_started = []
 
@@ -146,58 +158,75 @@ class ManualWorld(World):
 
                 # if the setting lists specific item names, limit the items to just those
                 if "items" in starting_item_block:
-                    items = [item for item in pool if item.name in starting_item_block["items"]]
+                    item_names = set(starting_item_block["items"])
+                    items = [item for item in pool if item.name in item_names]
 
                 # if the setting lists specific item categories, limit the items to ones that have any of those categories
                 if "item_categories" in starting_item_block:
-                    items_in_categories = [item["name"] for item in self.item_name_to_item.values() if "category" in item and len(set(starting_item_block["item_categories"]).intersection(item["category"])) > 0]
+                    items_in_categories = {item["name"] for item in self.item_name_to_item.values() if "category" in item and len(set(starting_item_block["item_categories"]).intersection(item["category"])) > 0}
                     items = [item for item in pool if item.name in items_in_categories]
 
-                self.random.shuffle(items)
+                # the full pool is shuffled and walked as a list, while its items are taken out of it
+                walks_pool = items is pool
+                if walks_pool:
+                    items = list(pool)
+                    self.random.shuffle(items)
+                    pool[:] = items
+                else:
+                    self.random.shuffle(items)
 
                 # if the setting lists a specific number of random items that should be pulled, only use a subset equal to that number
                 if "random" in starting_item_block:
                     items = items[0:starting_item_block["random"]]
+                    walks_pool = False
 
                 for starting_item in items:
                     items_started.append(starting_item)
                     self.multiworld.push_precollected(starting_item)
                     pool.remove(starting_item)
+                    if walks_pool:
+                        items.remove(starting_item)
 
-        self.start_inventory = {i.name: items_started.count(i) for i in items_started}
+        self.start_inventory = dict(Counter(i.name for i in items_started))
 
         pool = before_create_items_filler(pool, self, self.multiworld, self.player)
+        if not isinstance(pool, ItemPool):
+            pool = ItemPool(self, pool)
         pool = self.adjust_filler_items(pool, traps)
         pool = after_create_items(pool, self, self.multiworld, self.player)
 
         # need to put all of the items in the pool so we can have a full state for placement
         # then will remove specific item placements below from the overall pool
-        self.multiworld.itempool += pool
+        self.multiworld.itempool += list(pool)
 
-    def create_item(self, name: str) -> Item:
-        name = before_create_item(name, self, self.multiworld, self.player)
+        # the item counts of the rules compiled in set_rules, counted again at the end of generate_basic
+        self.item_counts[self.player] = self.count_items(pool)
 
-        item = self.item_name_to_item[name]
-        classification = ItemClassification.filler
+    def create_item(self, name: str) -> Item:
+        if before_create_item_used:
+            name = before_create_item(name, self, self.multiworld, self.player)
 
-        if "trap" in item and item["trap"]:
-            classification = ItemClassification.trap
+        item_object = ManualItem(name, item_name_to_classification[name],
+                        self.item_name_to_id[name], player=self.player)
 
-        if "useful" in item and item["useful"]:
-            classification = ItemClassification.useful
+        if after_create_item_used:
+            item_object = after_create_item(item_object, self, self.multiworld, self.player)
 
-        if "progression" in item and item["progression"]:
-            classification = ItemClassification.progression
+        return item_object
 
-        if "progression_skip_balancing" in item and item["progression_skip_balancing"]:
-            classification = ItemClassification.progression_skip_balancing
+    def create_item_copies(self, name: str, count: int) -> list[Item]:
+        """Creates count copies of an item, like calling create_item count times."""
+        if before_create_item_used:
+            return [self.create_item(name) for _ in range(count)]
 
-        item_object = ManualItem(name, classification,
-                        self.item_name_to_id[name], player=self.player)
+        classification = item_name_to_classification[name]
+        item_id = self.item_name_to_id[name]
+        items = [ManualItem(name, classification, item_id, player=self.player) for _ in range(count)]
 
-        item_object = after_create_item(item_object, self, self.multiworld, self.player)
+        if after_create_item_used:
+            items = [after_create_item(item, self, self.multiworld, self.player) for item in items]
 
-        return item_object
+        return items
 
     def set_rules(self):
         before_set_rules(self, self.multiworld, self.player)
@@ -206,44 +235,98 @@ class ManualWorld(World):
 
         after_set_rules(self, self.multiworld, self.player)
 
+    def collect(self, state: CollectionState, item: Item) -> bool:
+        change = super().collect(state, item)
+        if not change:
+            return change
+
+        prog_items = state.prog_items[self.player]
+        prog_items[progression_count_key] += 1
+
+        # the rules reading the item get new versions when they're next evaluated for the state
+        versions = get_state_versions(state, self.player)
+        versions.pop(state_version_key, None)
+        for key in self.dependency_index.get(item.name, ()):
+            versions.pop(key, None)
+
+        if item.name in item_name_to_category_keys:
+            first_copy = prog_items[item.name] == 1
+            for count_key, distinct_key in item_name_to_category_keys[item.name]:
+                prog_items[count_key] += 1
+                if first_copy:
+                    prog_items[distinct_key] += 1
+
+        if item.name in item_name_to_value_weights:
+            for value_key, weight in item_name_to_value_weights[item.name]:
+                prog_items[value_key] += weight
+        return change
+
+    def remove(self, state: CollectionState, item: Item) -> bool:
+        change = super().remove(state, item)
+        if not change:
+            return change
+
+        prog_items = state.prog_items[self.player]
+        prog_items[progression_count_key] -= 1
+
+        versions = get_state_versions(state, self.player)
+        versions.pop(state_version_key, None)
+        for key in self.dependency_index.get(item.name, ()):
+            versions.pop(key, None)
+
+        if item.name in item_name_to_category_keys:
+            last_copy = prog_items[item.name] < 1
+            for count_key, distinct_key in item_name_to_category_keys[item.name]:
+                prog_items[count_key] -= 1
+                if prog_items[count_key] < 1:
+                    del prog_items[count_key]
+                if last_copy:
+                    prog_items[distinct_key] -= 1
+                    if prog_items[distinct_key] < 1:
+                        del prog_items[distinct_key]
+
+        if item.name in item_name_to_value_weights:
+            for value_key, weight in item_name_to_value_weights[item.name]:
+                prog_items[value_key] -= weight
+                if not prog_items[value_key]:
+                    del prog_items[value_key]
+        return change
+
     def generate_basic(self):
         before_generate_basic(self, self.multiworld, self.player)
 
-        # Handle item forbidding
-        manual_locations_with_forbid = {location['name']: location for location in location_name_to_location.values() if "dont_place_item" in location or "dont_place_item_category" in location}
-        locations_with_forbid = [l for l in self.multiworld.get_unfilled_locations(player=self.player) if l.name in manual_locations_with_forbid.keys()]
-        for location in locations_with_forbid:
-            manual_location = manual_locations_with_forbid[location.name]
-            forbidden_item_names = []
-
-            if "dont_place_item" in manual_location:
-                if len(manual_location["dont_place_item"]) == 0:
-                    continue
-
-                forbidden_item_names.extend([i["name"] for i in item_name_to_item.values() if i["name"] in manual_location["dont_place_item"]])
+        unfilled_locations = self.multiworld.get_unfilled_locations(player=self.player)
 
-            if "dont_place_item_category" in manual_location:
-                if len(manual_location["dont_place_item_category"]) == 0:
-                    continue
-
-                forbidden_item_names.extend([i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["dont_place_item_category"])])
-
-            if len(forbidden_item_names) > 0:
-                forbid_items_for_player(location, forbidden_item_names, self.player)
-                forbidden_item_names.clear()
+        # Handle item forbidding, with the item names of each location listed once in Locations.py
+        for location in unfilled_locations:
+            forbidden_item_names = location_name_to_forbidden_items.get(location.name)
+            if forbidden_item_names:
+                old_rule = location.item_rule
+                location.item_rule = ForbiddenItemsRule(forbidden_item_names, self.player,
+                                                        None if old_rule is type(location).item_rule else old_rule)
 
         # Handle specific item placements using fill_restrictive
-        manual_locations_with_placements = {location['name']: location for location in location_name_to_location.values() if "place_item" in location or "place_item_category" in location}
-        locations_with_placements = [l for l in self.multiworld.get_unfilled_locations(player=self.player) if l.name in manual_locations_with_placements.keys()]
+        locations_with_placements = [l for l in unfilled_locations if l.name in placement_location_names]
+        placed_items = set()
+        if locations_with_placements:
+            # the player's items of the pool by name, with their position so the eligible items keep the pool order
+            pool_index: dict[str, list[tuple[int, Item]]] = {}
+            for position, item in enumerate(self.multiworld.itempool):
+                if item.player == self.player:
+                    pool_index.setdefault(item.name, []).append((position, item))
+
+            def get_pool_items(item_names) -> list[Item]:
+                return [item for _, item in sorted((entry for name in item_names for entry in pool_index.get(name, ())), key=lambda entry: entry[0])]
+
         for location in locations_with_placements:
-            manual_location = manual_locations_with_placements[location.name]
+            manual_location = location_name_to_location[location.name]
             eligible_items = []
 
             if "place_item" in manual_location:
                 if len(manual_location["place_item"]) == 0:
                     continue
 
-                eligible_items = [item for item in self.multiworld.itempool if item.name in manual_location["place_item"] and item.player == self.player]
+                eligible_items = get_pool_items(set(manual_location["place_item"]))
 
                 if len(eligible_items) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match %s." % (manual_location["name"], ", ".join(manual_location["place_item"])))
@@ -252,8 +335,7 @@ class ManualWorld(World):
                 if len(manual_location["place_item_category"]) == 0:
                     continue
 
-                eligible_item_names = [i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["place_item_category"])]
-                eligible_items = [item for item in self.multiworld.itempool if item.name in eligible_item_names and item.player == self.player]
+                eligible_items = get_pool_items(get_category_item_names(manual_location["place_item_category"]))
 
                 if len(eligible_items) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match categories %s." % (manual_location["name"], ", ".join(manual_location["place_item_category"])))
@@ -271,13 +353,12 @@ class ManualWorld(World):
                 if len(manual_location["dont_place_item_category"]) == 0:
                     continue
 
-                forbidden_item_names = [i["name"] for i in item_name_to_item.values() if "category" in i and set(i["category"]).intersection(manual_location["dont_place_item_category"])]
+                forbidden_item_names = get_category_item_names(manual_location["dont_place_item_category"])
 
                 eligible_items = [item for item in eligible_items if item.name not in forbidden_item_names]
 
                 if len(eligible_items) == 0:
                     raise Exception("Could not find a suitable item to place at %s. No items that match placed_items(_category) because of forbidden categories %s." % (manual_location["name"], ", ".join(manual_location["dont_place_item_category"])))
-                forbidden_item_names.clear()
 
 
             # if we made it here and items is empty, then we encountered an unknown issue... but also can't do anything to place, so error
@@ -287,12 +368,26 @@ class ManualWorld(World):
             item_to_place = self.random.choice(eligible_items)
             location.place_locked_item(item_to_place)
 
-            # remove the item we're about to place from the pool so it isn't placed twice
-            self.multiworld.itempool.remove(item_to_place)
+            # take the item we're about to place out of the index so it isn't placed twice, the pool is rebuilt once below
+            pool_index[item_to_place.name] = [entry for entry in pool_index[item_to_place.name] if entry[1] is not item_to_place]
+            placed_items.add(id(item_to_place))
 
+        if placed_items:
+            self.multiworld.itempool[:] = [item for item in self.multiworld.itempool if id(item) not in placed_items]
 
         after_generate_basic(self, self.multiworld, self.player)
 
+        # The item pool is complete, so the item counts are final and the 'all', 'half' and 'N%' counts of the requires
+        # can be turned into numbers of items.
+        # A hook changing the pool after this should call self.invalidate_item_counts() and self.rule_compiler.resolve_thresholds() again.
+        self.item_counts[self.player] = self.count_items()
+        if self.rule_compiler is not None:
+            self.rule_compiler.resolve_thresholds()
+
+        # Enable this in Meta.json to make the progression items no rule requires useful instead
+        if enable_progression_demotion:
+            self.demote_unobserved_progression()
+
         # Enable this in Meta.json to generate a diagram of your manual.  Only works on 0.4.4+
         if enable_region_diagram:
             from Utils import visualize_regions
@@ -317,6 +412,11 @@ class ManualWorld(World):
         return slot_data
 
     def generate_output(self, output_directory: str):
+        if self.rule_profiler is not None:
+            logging.info(f"{self.game} rules of player {self.player} during fill: {self.rule_profiler.summary(10)}")
+        if self.shadow_rules is not None:
+            logging.info(f"{self.game} rules of player {self.player}: {self.shadow_rules.summary()}")
+
         data = self.client_data()
         filename = f"{self.multiworld.get_out_file_name_base(self.player)}.apmanual"
         with open(os.path.join(output_directory, filename), 'wb') as f:
@@ -325,6 +425,14 @@ class ManualWorld(World):
     def write_spoiler(self, spoiler_handle):
         before_write_spoiler(self, self.multiworld, spoiler_handle)
 
+        if self.demoted_items:
+            spoiler_handle.write(f"\n\nProgression items of {self.multiworld.get_player_name(self.player)} made useful, as no location or region requires them:\n")
+            for name, count in sorted(self.demoted_items.items()):
+                spoiler_handle.write(f"  {name}: {count}\n")
+
+        if self.rule_profiler is not None:
+            spoiler_handle.write(f"\n\n{self.game} rules of {self.multiworld.get_player_name(self.player)}: {self.rule_profiler.summary()}\n")
+
     ###
     # Non-standard AP world methods
     ###
@@ -334,7 +442,7 @@ class ManualWorld(World):
         return self.adjust_filler_items(item_pool, traps)
 
     def adjust_filler_items(self, item_pool, traps):
-        extras = len(self.multiworld.get_unfilled_locations(player=self.player)) - len(item_pool)
+        extras = self.get_unfilled_location_count() - len(item_pool)
 
         if extras > 0:
             trap_percent = get_option_value(self.multiworld, self.player, "filler_traps")
@@ -348,9 +456,7 @@ class ManualWorld(World):
                 extra_item = self.create_item(self.random.choice(traps))
                 item_pool.append(extra_item)
 
-            for _ in range(0, filler_count):
-                extra_item = self.create_item(filler_item_name)
-                item_pool.append(extra_item)
+            item_pool.extend(self.create_item_copies(filler_item_name, filler_count))
         elif extras < 0:
             logging.warning(f"{self.game} has more items than locations. {abs(extras)} non-progression items will be removed at random.")
             fillers = [item for item in item_pool if item.classification == ItemClassification.filler]
@@ -359,29 +465,72 @@ class ManualWorld(World):
             self.random.shuffle(fillers)
             self.random.shuffle(traps)
             self.random.shuffle(useful)
-            for _ in range(0, abs(extras)):
-                popped = None
-                if fillers:
-                    popped = fillers.pop()
-                elif traps:
-                    popped = traps.pop()
-                elif useful:
-                    popped = useful.pop()
+
+            # fillers go first, then traps, then useful items, each from the end of its shuffled list
+            removable = fillers[::-1] + traps[::-1] + useful[::-1]
+            if len(removable) < abs(extras):
+                logging.warning("Could not remove enough non-progression items from the pool.")
+
+            # like item_pool.remove for each of them, the first equal items of the pool are the ones removed
+            to_remove = Counter(removable[:abs(extras)])
+            kept_items = []
+            for item in item_pool:
+                if to_remove[item] > 0:
+                    to_remove[item] -= 1
                 else:
-                    logging.warning("Could not remove enough non-progression items from the pool.")
-                    break
-                item_pool.remove(popped)
+                    kept_items.append(item)
+            item_pool[:] = kept_items
 
         return item_pool
 
+    def get_unfilled_location_count(self) -> int:
+        """returns how many of the player's own locations have no item yet"""
+        return sum(1 for location in self.multiworld.get_locations(self.player) if location.item is None)
+
+    def demote_unobserved_progression(self):
+        """Turns the progression items of the pool that none of the world's rules can read into useful items,
+        so fill and balancing don't have to place them. Nothing is demoted if a rule calls a function from hooks/Rules.py
+        that isn't @state_independent, since it could read any item. Rules set by hooks aren't seen either,
+        so only enable this if your hooks don't set any."""
+        observed = self.rule_compiler.observed_items() if self.rule_compiler is not None else None
+        if observed is None:
+            logging.info(f"{self.game} can't demote the unused progression items of player {self.player}, its rules call functions.")
+            return
+
+        self.demoted_items = {}
+        for item in self.multiworld.itempool:
+            if item.player == self.player and item.advancement and item.name not in observed and item.name != "__Victory__":
+                item.classification = ItemClassification.useful
+                self.demoted_items[item.name] = self.demoted_items.get(item.name, 0) + 1
+
+        if self.demoted_items:
+            logging.info(f"{self.game} demoted {sum(self.demoted_items.values())} progression items of player {self.player} to useful: {', '.join(sorted(self.demoted_items))}")
+
     def get_item_counts(self, player: Optional[int] = None, reset: bool = False) -> dict[str, int]:
-        """returns the player real item count"""
-        if player is None:
-            player = self.player
-        if not self.item_counts.get(player, {}) or reset:
-            real_pool = self.multiworld.get_items()
-            self.item_counts[player] = {i.name: real_pool.count(i) for i in real_pool if i.player == player}
-        return self.item_counts.get(player)
+        """returns the player real item count, from its pool, its placed items and its starting items"""
+        if player is not None and player != self.player:
+            item_counts = Counter(item.name for item in self.multiworld.get_items() if item.player == player)
+            item_counts.update(item.name for item in self.multiworld.precollected_items[player])
+            return item_counts
+        if self.player not in self.item_counts or reset:
+            self.item_counts[self.player] = self.count_items()
+        return self.item_counts[self.player]
+
+    def count_items(self, pool: Optional[Iterable[Item]] = None) -> Counter:
+        """Counts the player's items by name: the ones of the pool, the ones placed at its own locations and its starting items.
+        pool is the player's own part of the item pool, taken from the multiworld's pool when not given.
+        Its items placed at the locations of other players aren't counted, only hooks place items there before fill."""
+        if pool is None:
+            pool = (item for item in self.multiworld.itempool if item.player == self.player)
+        item_counts = Counter(item.name for item in pool)
+        item_counts.update(location.item.name for location in self.multiworld.get_locations(self.player)
+                           if location.item is not None and location.item.player == self.player)
+        item_counts.update(item.name for item in self.multiworld.precollected_items[self.player])
+        return item_counts
+
+    def invalidate_item_counts(self):
+        """Makes the next get_item_counts count the items again, for hooks changing the pool after it was counted."""
+        self.item_counts.pop(self.player, None)
 
     def client_data(self):
         return {
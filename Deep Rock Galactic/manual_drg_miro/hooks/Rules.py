@@ -1,21 +1,26 @@
+from functools import lru_cache
 from typing import Optional
 from worlds.AutoWorld import World
-from ..Helpers import clamp, get_items_with_value
+from ..Helpers import clamp, has_all_of_category, reads, state_independent
+from ..Items import item_name_groups, item_value_key
 from BaseClasses import MultiWorld, CollectionState
 
 import re
 
 # Sometimes you have a requirement that is just too messy or repetitive to write out with boolean logic.
 # Define a function here, and you can use it in a requires string with {function_name()}.
+# If you declare every item and category it reads with @reads, its results are remembered for each state until one of them changes.
+@reads(categories=[cat for cat in item_name_groups if cat.endswith("Fishing Log")])
 def overfishedAnywhere(world: World, multiworld: MultiWorld, state: CollectionState, player: int):
     """Has the player collected all fish from any fishing log?"""
-    for cat, items in world.item_name_groups:
-        if cat.endswith("Fishing Log") and state.has_all(items, player):
+    for cat in world.item_name_groups:
+        if cat.endswith("Fishing Log") and has_all_of_category(world, state, player, cat):
             return True
     return False
 
 # You can also pass an argument to your function, like {function_name(15)}
 # Note that all arguments are strings, so you'll need to convert them to ints if you want to do math.
+@reads("Figher Level", "Black Belt Level", "Thief Level", "Red Mage Level", "White Mage Level", "Black Mage Level")
 def anyClassLevel(world: World, multiworld: MultiWorld, state: CollectionState, player: int, level: str):
     """Has the player reached the given level in any class?"""
     for item in ["Figher Level", "Black Belt Level", "Thief Level", "Red Mage Level", "White Mage Level", "Black Mage Level"]:
@@ -24,6 +29,7 @@ def anyClassLevel(world: World, multiworld: MultiWorld, state: CollectionState,
     return False
 
 # You can also return a string from your function, and it will be evaluated as a requires string.
+@reads("Figher Level", "Black Belt Level", "Thief Level")
 def requiresMelee(world: World, multiworld: MultiWorld, state: CollectionState, player: int):
     """Returns a requires string that checks if the player has unlocked the tank."""
     return "|Figher Level:15| or |Black Belt Level:15| or |Thief Level:15|"
@@ -33,37 +39,21 @@ def ItemValue(world: World, multiworld: MultiWorld, state: CollectionState, play
     this function will check if the player has collect at least 'int' valueName worth of items\n
     eg. {ItemValue(Coins:12)} will check if the player has collect at least 12 coins worth of items
     """
+    value_key, count = parse_item_value(args)
+    # ManualWorld.collect/remove keep the running total of every value in the state itself, see Items.item_value_key
+    return state.prog_items[player][value_key] >= count
 
+@lru_cache(maxsize=None)
+def parse_item_value(args: str) -> tuple[str, int]:
     args_list = args.split(":")
-    if not len(args_list) == 2 or not args_list[1].isnumeric():
+    if not len(args_list) == 2 or not args_list[1].strip().isnumeric():
         raise Exception(f"ItemValue needs a number after : so it looks something like 'ItemValue({args_list[0]}:12)'")
-    args_list[0] = args_list[0].lower().strip()
-    args_list[1] = int(args_list[1].strip())
-
-    if not hasattr(world, 'item_values_cache'): #Cache made for optimization purposes
-        world.item_values_cache = {}
-
-    if not world.item_values_cache.get(player, {}):
-        world.item_values_cache[player] = {
-            'state': {},
-            'count': {},
-            }
-
-    if (args_list[0] not in world.item_values_cache[player].get('count', {}).keys()
-            or world.item_values_cache[player].get('state') != dict(state.prog_items[player])):
-        #Run First Time or if state changed since last check
-        existing_item_values = get_items_with_value(world, multiworld, args_list[0])
-        total_Count = 0
-        for name, value in existing_item_values.items():
-            count = state.count(name, player)
-            if count > 0:
-                total_Count += count * value
-        world.item_values_cache[player]['count'][args_list[0]] = total_Count
-        world.item_values_cache[player]['state'] = dict(state.prog_items[player]) #save the current gotten items to check later if its the same
-    return world.item_values_cache[player]['count'][args_list[0]] >= args_list[1]
+    return item_value_key(args_list[0]), int(args_list[1].strip())
 
 
 # Two useful functions to make require work if an item is disabled instead of making it inaccessible
+# They only look at the item pool, so @state_independent has them called once when the rules are compiled
+@state_independent
 def OptOne(world: World, multiworld: MultiWorld, state: CollectionState, player: int, item: str, items_counts: Optional[dict] = None):
     """Check if the passed item (with or without ||) is enabled, then this returns |item:count|
     where count is clamped to the maximum number of said item in the itempool.\n
@@ -103,6 +93,7 @@ def OptOne(world: World, multiworld: MultiWorld, state: CollectionState, player:
         return f"|{item_name}:{item_count}|"
 
 # OptAll check the passed require string and loop every item to check if they're enabled,
+@state_independent
 def OptAll(world: World, multiworld: MultiWorld, state: CollectionState, player: int, requires: str):
     """Check the passed require string and loop every item to check if they're enabled,
     then returns the require string with items counts adjusted using OptOne\n
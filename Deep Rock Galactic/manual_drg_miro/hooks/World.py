@@ -4,6 +4,7 @@ from BaseClasses import MultiWorld, CollectionState
 
 # Object classes from Manual -- extending AP core -- representing items and locations that are used in generation
 from ..Items import ManualItem
+from ..ItemPool import ItemPool
 from ..Locations import ManualLocation
 
 # Raw JSON data from the Manual apworld, respectively:
@@ -12,7 +13,7 @@ from ..Locations import ManualLocation
 from ..Data import game_table, item_table, location_table, region_table
 
 # These helper methods allow you to determine if an option has been set, or what its value is, for any player in the multiworld
-from ..Helpers import is_option_enabled, get_option_value
+from ..Helpers import is_option_enabled, get_option_value, passthrough
 
 # calling logging.info("message") anywhere below in this file will output the message to both console and log file
 import logging
@@ -74,7 +75,11 @@ def after_create_regions(world: World, multiworld: MultiWorld, player: int):
 
 
 # The item pool before starting items are processed, in case you want to see the raw item pool at that stage
-def before_create_items_starting(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+# The item pools given to the create_items hooks are an ItemPool (see ItemPool.py) rather than a list. It supports the list
+# operations (indexing, len, iteration, append, extend, remove, sort...) and also item_pool.take("Item Name"),
+# item_pool.take_many(names), item_pool.precollect(names) and item_pool.remove_category("Category"), which find the items by name.
+# It isn't a list subclass, so use list(item_pool) where an actual list is needed. Returning a list is fine too.
+def before_create_items_starting(item_pool: ItemPool, world: World, multiworld: MultiWorld, player: int) -> ItemPool:
     
     locationNamesToRemove = []
     itemNamesToRemove = []
@@ -86,17 +91,13 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
         missions = ["Mining Expedition", "Egg Hunt", "On-site Refining", "Salvage Operation", "Point Extraction", "Escort Duty", "Elimination", "Industrial Sabotage", "Deep Scan"]
         multiworld.random.shuffle(missions)
         missions_to_delete = missions[assignment_count:] #Deletes missions starting from index assignment_count
-        for itemName in missions_to_delete: 
-            delete_item = next(i for i in item_pool if i.name == itemName)
-            item_pool.remove(delete_item)
+        item_pool.take_many(missions_to_delete)
         
         #Set assignment count item for logic:
-        assignment_counter = next(item for item in item_pool if item.name == f"Logic-only item for {assignment_count} assignments")
-        multiworld.push_precollected(assignment_counter)
+        item_pool.precollect([f"Logic-only item for {assignment_count} assignments"])
         items_to_remove = ["Logic-only item for 4 assignments","Logic-only item for 5 assignments","Logic-only item for 6 assignments","Logic-only item for 7 assignments","Logic-only item for 8 assignments"]
-        for itemName in items_to_remove:
-            delete_item = next(i for i in item_pool if i.name == itemName)
-            item_pool.remove(delete_item)
+        items_to_remove.remove(f"Logic-only item for {assignment_count} assignments")
+        item_pool.take_many(items_to_remove)
         
         #Start inventory and easy start yaml option:
         start_inventory_items = [missions[0]] #last 0-4 are deleted above, the first is never deleted
@@ -111,10 +112,7 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
             secondary_weapons = ["Secondary Weapon 1", "Secondary Weapon 2", "Secondary Weapon 3"]
             multiworld.random.shuffle(secondary_weapons)
             start_inventory_items += secondary_weapons[2:]
-        for itemName in start_inventory_items: #precollect items, then delete from item pool.
-            start_inventory = next(item for item in item_pool if item.name == itemName)
-            multiworld.push_precollected(start_inventory)
-            item_pool.remove(start_inventory)
+        item_pool.precollect(start_inventory_items) #precollect items, then delete from item pool.
     
     else:
         #Randomly select missions, remove unneeded locations and items:
@@ -125,9 +123,8 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
             missions_to_delete = missions[mission_count:] #Deletes missions starting from index mission_count
             #print(f"missions_to_delete: {missions_to_delete}")
             for itemName in missions_to_delete: 
-                delete_item = next(i for i in item_pool if i.name == itemName)
-                item_pool.remove(delete_item)
-                #print(f"delete_item: {delete_item}")
+                item_pool.take(itemName)
+                #print(f"delete_item: {itemName}")
                 locationNamesToRemove += [f"{itemName} - Reward 1", f"{itemName} - Reward 2"]
             #print(f"locationNamesToRemove: {locationNamesToRemove}")
             missions = missions[:mission_count]
@@ -137,10 +134,7 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
         if starting_mission_count > mission_count:
             starting_mission_count = mission_count
         start_inventory_items = missions[:starting_mission_count]
-        for itemName in start_inventory_items: #precollect items, then delete from item pool.
-            start_inventory = next(item for item in item_pool if item.name == itemName)
-            multiworld.push_precollected(start_inventory)
-            item_pool.remove(start_inventory)
+        item_pool.precollect(start_inventory_items) #precollect items, then delete from item pool.
         
         #Set missions required for goal:
         mission_completions_required = get_option_value(multiworld, player, "long_mission_completions_to_win")
@@ -158,13 +152,13 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
         
         #include secondary objectives, warnings and/or anomalies:
         if get_option_value(multiworld, player, "long_secondary_objectives") == False:
-            itemNamesToRemove += world.item_name_groups["(L) Secondary objectives"]
+            item_pool.remove_category("(L) Secondary objectives")
             locationNamesToRemove += world.location_name_groups["Secondary objectives"]
         if get_option_value(multiworld, player, "long_warnings") == False:
-            itemNamesToRemove += world.item_name_groups["(L) Warning mutators"]
+            item_pool.remove_category("(L) Warning mutators")
             locationNamesToRemove += world.location_name_groups["Warning mutators"]
         if get_option_value(multiworld, player, "long_anomalies") == False:
-            itemNamesToRemove += world.item_name_groups["(L) Anomaly mutators"]
+            item_pool.remove_category("(L) Anomaly mutators")
             locationNamesToRemove += world.location_name_groups["Anomaly mutators"]
             
         #include (elite) deep dives, weekly assignments and/or season challenges:
@@ -215,15 +209,13 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
 
     #print(itemNamesToRemove)
     #print(item_pool)
-    for itemName in itemNamesToRemove:
-        item = next(i for i in item_pool if i.name == itemName)
-        item_pool.remove(item)
+    item_pool.take_many(itemNamesToRemove)
 
 
     return item_pool
 
-# The item pool after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
-def before_create_items_filler(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+# The item pool (an ItemPool, see before_create_items_starting) after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
+def before_create_items_filler(item_pool: ItemPool, world: World, multiworld: MultiWorld, player: int) -> ItemPool:
 
     itemNamesToRemove = []
 
@@ -238,13 +230,10 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
         last_assignment_location = f"Assignment {assignment_count}-3"
         #print(last_assignment_location)
         location = multiworld.get_location(last_assignment_location, player)
-        item_to_place = next(i for i in item_pool if i.name == "Assignments Complete!")
+        item_to_place = item_pool.take("Assignments Complete!")
         location.place_locked_item(item_to_place)
-        item_pool.remove(item_to_place)
 
-    for itemName in itemNamesToRemove:
-        item = next(i for i in item_pool if i.name == itemName)
-        item_pool.remove(item)
+    item_pool.take_many(itemNamesToRemove)
 
     return item_pool
 
@@ -252,12 +241,11 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
 
     ## Place an item at a specific location
     # location = next(l for l in multiworld.get_unfilled_locations(player=player) if l.name == "Location Name")
-    # item_to_place = next(i for i in item_pool if i.name == "Item Name")
+    # item_to_place = item_pool.take("Item Name")
     # location.place_locked_item(item_to_place)
-    # item_pool.remove(item_to_place)
 
-# The complete item pool prior to being set for generation is provided here, in case you want to make changes to it
-def after_create_items(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+# The complete item pool (an ItemPool, see before_create_items_starting) prior to being set for generation is provided here, in case you want to make changes to it
+def after_create_items(item_pool: ItemPool, world: World, multiworld: MultiWorld, player: int) -> ItemPool:
     return item_pool
 
 # Called before rules for accessing regions and locations are created. Not clear why you'd want this, but it's here.
@@ -284,11 +272,13 @@ def after_set_rules(world: World, multiworld: MultiWorld, player: int):
     # OR
     # location.access_rule = lambda state: old_rule(state) or Example_Rule(state)
 
-# The item name to create is provided before the item is created, in case you want to make changes to it
+# The item name to create is provided before the item is created, in case you want to make changes to it (and remove @passthrough when you do)
+@passthrough
 def before_create_item(item_name: str, world: World, multiworld: MultiWorld, player: int) -> str:
     return item_name
 
-# The item that was created is provided after creation, in case you want to modify the item
+# The item that was created is provided after creation, in case you want to modify the item (and remove @passthrough when you do)
+@passthrough
 def after_create_item(item: ManualItem, world: World, multiworld: MultiWorld, player: int) -> ManualItem:
     return item
 
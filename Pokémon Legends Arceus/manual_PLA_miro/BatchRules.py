@@ -0,0 +1,188 @@
+from typing import TYPE_CHECKING, Union
+from BaseClasses import CollectionState
+from .Items import get_state_versions, item_name_to_id, state_version_key, state_versions
+from .Game import starting_index
+from .RuleCompiler import And, CompiledRule, Constant, FoldedCall, HasAllCounts, HasAnyCount, HasCategory, HasItem, Not, Or, RequiresNode, calls_functions
+
+import logging
+
+numpy_loaded = False
+try:
+    import numpy as np
+    numpy_loaded = True
+except ModuleNotFoundError:
+    pass
+
+if TYPE_CHECKING:
+    from .RuleCompiler import RuleCompiler
+
+class BatchRules:
+    """Engine mode of the compiled rules (enable_batch_rules in meta.json, needs numpy).
+    Every cacheable rule is lowered into array operations over the item counts of the player, indexed by item id,
+    so one call evaluates the requires of every location and region for a state. The access rules are views of that result."""
+
+    max_cached_results = 16
+
+    def __init__(self, compiler: "RuleCompiler"):
+        self.compiler = compiler
+        self.player = compiler.player
+        self.areas: list[str] = []
+        self.area_rules: list[CompiledRule] = []
+        self.positions: dict[CompiledRule, int] = {}
+        self.results: dict[int, "np.ndarray"] = {}
+        self.lowered = False
+
+    def __getstate__(self):
+        # the cached results are keyed by the state versions of this process
+        return {**self.__dict__, "results": {}}
+
+    def add_area(self, area_name: str, rule: CompiledRule):
+        """Registers the compiled requires of a location/region, in the order of evaluate_areas."""
+        self.areas.append(area_name)
+        self.area_rules.append(rule)
+
+    def check(self, state: CollectionState, rule: CompiledRule) -> bool:
+        """The access rule of one location/region, read from the batch result of the state."""
+        if rule not in self.positions:
+            if self.lowered:
+                return rule.evaluate(state, self.compiler)  # it calls hooks/Rules.py functions, so it wasn't lowered
+            self.lower()
+            return self.check(state, rule)
+        return bool(self.evaluate(state)[self.positions[rule]])
+
+    def evaluate_areas(self, state: CollectionState) -> "np.ndarray":
+        """Returns whether the requires of every registered location/region are met, in the order of self.areas.
+        This is only the requires of each area, a location also needs its region to be reachable."""
+        results = self.evaluate(state)[self.area_positions]
+        for index, rule in self.unlowered_areas:
+            results[index] = rule.evaluate(state, self.compiler)
+        return results
+
+    def evaluate(self, state: CollectionState) -> "np.ndarray":
+        """Evaluates every lowered node for the state, the result of a rule is at self.positions[rule]."""
+        if not self.lowered:
+            self.lower()
+
+        prog_items = state.prog_items[self.player]
+        versions = get_state_versions(state, self.player)
+        version = versions.get(state_version_key)
+        if version is None:
+            version = versions[state_version_key] = next(state_versions)
+        values = self.results.get(version)
+        if values is not None:
+            return values
+
+        counts = np.zeros(self.column_count, dtype=np.int64)
+        columns = self.columns
+        for name, count in prog_items.items():
+            column = columns.get(name)
+            if column is not None:
+                counts[column] = count
+
+        values = np.empty(self.node_count, dtype=bool)
+        values[self.constant_nodes] = self.constant_values
+        values[self.leaf_nodes] = counts[self.leaf_columns] >= self.leaf_thresholds
+        # each level only reads the levels below it
+        for and_nodes, and_operands, and_offsets, or_nodes, or_operands, or_offsets, not_nodes, not_operands in self.levels:
+            if len(and_nodes):
+                values[and_nodes] = np.logical_and.reduceat(values[and_operands], and_offsets)
+            if len(or_nodes):
+                values[or_nodes] = np.logical_or.reduceat(values[or_operands], or_offsets)
+            if len(not_nodes):
+                values[not_nodes] = ~values[not_operands]
+
+        if len(self.results) >= self.max_cached_results:
+            self.results.clear()
+        self.results[version] = values
+        return values
+
+    def lower(self):
+        """Turns the compiled rules into the node arrays used by evaluate, with their thresholds from RuleCompiler.resolve_thresholds.
+        Done on the first evaluation, and again after the thresholds are resolved again."""
+        self.positions.clear()
+        # item columns follow the sequential item ids of Items.py, categories use their tally from ManualWorld.collect
+        self.columns: dict[str, int] = {name: item_id - starting_index for name, item_id in item_name_to_id.items() if item_id is not None}
+        self.column_count = max(self.columns.values(), default=-1) + 1
+
+        nodes: dict[int, tuple[int, int]] = {}
+        constants: list[tuple[int, bool]] = []
+        leaves: list[tuple[int, int, int]] = []
+        operators: list[tuple[int, int, type, list[int]]] = []  # level, position, operator type, operand positions
+
+        def column(name: str) -> int:
+            if name not in self.columns:
+                self.columns[name] = self.column_count
+                self.column_count += 1
+            return self.columns[name]
+
+        def threshold(node: Union[HasItem, HasCategory]) -> int:
+            return node.threshold if node.threshold is not None else node.resolve(self.compiler.world.get_item_counts())
+
+        def lower_node(node: RequiresNode) -> tuple[int, int]:
+            """Returns the position and level of a node."""
+            if isinstance(node, (CompiledRule, FoldedCall)):
+                return lower_node(node.expression)
+            if id(node) in nodes:
+                return nodes[id(node)]
+
+            # operands first, so they get their positions before this node
+            if isinstance(node, (HasAllCounts, HasAnyCount)):
+                operands = [lower_node(leaf) for leaf in node.leaves]
+            else:
+                operands = [lower_node(operand) for operand in node.operands()]
+            position = len(nodes)
+            level = 0
+            if isinstance(node, Constant):
+                constants.append((position, node.value))
+            elif isinstance(node, HasItem):
+                leaves.append((position, column(node.item), threshold(node)))
+            elif isinstance(node, HasCategory):
+                if not node.items:
+                    constants.append((position, False))
+                else:
+                    leaves.append((position, column(node.key), threshold(node)))
+            elif isinstance(node, (And, Or, Not, HasAllCounts, HasAnyCount)):
+                operator = {HasAllCounts: And, HasAnyCount: Or}.get(type(node), type(node))
+                level = 1 + max(operand_level for _, operand_level in operands)
+                operators.append((level, position, operator, [operand_position for operand_position, _ in operands]))
+            else:
+                raise ValueError(f"{type(node).__name__} can't be lowered into a batch rule.")
+
+            nodes[id(node)] = (position, level)
+            return position, level
+
+        for rule in (*self.compiler.rules.values(), *self.compiler.shared.values()):
+            if rule.cacheable and not calls_functions(rule):
+                self.positions[rule] = lower_node(rule)[0]
+
+        # the rules calling functions aren't lowered, evaluate_areas patches their results in
+        self.area_positions = np.array([self.positions.get(rule, 0) for rule in self.area_rules], dtype=np.intp)
+        self.unlowered_areas = [(index, rule) for index, rule in enumerate(self.area_rules) if rule not in self.positions]
+
+        self.node_count = len(nodes)
+        self.constant_nodes = np.array([position for position, _ in constants], dtype=np.intp)
+        self.constant_values = np.array([value for _, value in constants], dtype=bool)
+        self.leaf_nodes = np.array([position for position, _, _ in leaves], dtype=np.intp)
+        self.leaf_columns = np.array([leaf_column for _, leaf_column, _ in leaves], dtype=np.intp)
+        self.leaf_thresholds = np.array([threshold for _, _, threshold in leaves], dtype=np.int64)
+
+        self.levels = []
+        for level in range(1, max((level for level, _, _, _ in operators), default=0) + 1):
+            level_arrays = []
+            for operator in (And, Or):
+                positions, operands, offsets = [], [], []
+                for operator_level, position, operator_type, operand_positions in operators:
+                    if operator_level == level and operator_type is operator:
+                        positions.append(position)
+                        offsets.append(len(operands))
+                        operands.extend(operand_positions)
+                level_arrays += [np.array(positions, dtype=np.intp), np.array(operands, dtype=np.intp), np.array(offsets, dtype=np.intp)]
+            not_operators = [(position, operand_positions[0]) for operator_level, position, operator_type, operand_positions in operators
+                             if operator_level == level and operator_type is Not]
+            level_arrays += [np.array([position for position, _ in not_operators], dtype=np.intp),
+                             np.array([operand for _, operand in not_operators], dtype=np.intp)]
+            self.levels.append(tuple(level_arrays))
+
+        self.results.clear()
+        self.lowered = True
+        logging.debug(f"Lowered {len(self.positions)} rules of player {self.player} into {self.node_count} batch nodes over {self.column_count} item columns.")
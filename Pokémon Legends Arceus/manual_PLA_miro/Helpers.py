@@ -1,8 +1,8 @@
-from BaseClasses import MultiWorld, Item
-from typing import Optional, List
+from BaseClasses import MultiWorld, Item, CollectionState
+from typing import Iterable, Optional, List
 from worlds.AutoWorld import World
 from .Data import category_table
-from .Items import ManualItem
+from .Items import ManualItem, category_count_key, category_distinct_key
 from .Locations import ManualLocation
 from .hooks.Helpers import before_is_category_enabled, before_is_item_enabled, before_is_location_enabled
 
@@ -89,6 +89,45 @@ def _is_manualobject_enabled(multiworld: MultiWorld, player: int, object: any) -
 
     return enabled
 
+def get_category_count(state: CollectionState, player: int, category_name: str, distinct: bool = False) -> int:
+    """Return how many items of a category the player has collected in this state,
+    or how many different items of it if 'distinct' is True.\n
+    These totals are kept up to date by ManualWorld.collect/remove, so this is a single lookup
+    """
+    key = category_distinct_key(category_name) if distinct else category_count_key(category_name)
+    return state.prog_items[player][key]
+
+def has_all_of_category(world: World, state: CollectionState, player: int, category_name: str) -> bool:
+    """Check if the player has collected at least one of every item in a category, like state.has_all would"""
+    return get_category_count(state, player, category_name, True) >= len(world.item_name_groups.get(category_name, []))
+
+def state_independent(func):
+    """Decorator for the functions of hooks/Rules.py that never read the state, only the world and its item pool.
+
+    They are called once with a state of None when the rules are compiled, and again when the pool changes,
+    and their result is compiled into the rules instead of calling them on every access check
+    """
+    func.state_independent = True
+    return func
+
+def reads(*items: str, categories: Iterable[str] = ()):
+    """Decorator for the functions of hooks/Rules.py declaring every item and category they read from the state.
+
+    Their results are remembered on each state until one of those items is collected or removed, and the rules calling them
+    are cached like the others. A function returning a requires string must declare the items of that string too
+    """
+    def decorator(func):
+        func.reads_items = tuple(items)
+        func.reads_categories = tuple(categories)
+        return func
+    return decorator
+
+def passthrough(func):
+    """Decorator for the hooks that only return their first argument as it is, like the ones of the template.
+    Manual skips calling them, so remove it from a hook once it does something"""
+    func.passthrough = True
+    return func
+
 def get_items_for_player(multiworld: MultiWorld, player: int) -> List[Item]:
     """Return list of items of a player including placed items"""
     return [i for i in multiworld.get_items() if i.player == player]
@@ -1,8 +1,10 @@
-from BaseClasses import Item
+from BaseClasses import CollectionState, Item, ItemClassification
 from .Data import item_table
 from .Game import filler_item_name, starting_index
 from .hooks.Items import before_item_table_processed
 
+import itertools
+
 item_table = before_item_table_processed(item_table)
 
 ######################
@@ -52,6 +54,98 @@ item_id_to_name[None] = "__Victory__"
 item_name_to_id = {name: id for id, name in item_id_to_name.items()}
 
 
+######################
+# State bookkeeping
+######################
+
+# States sharing a version have the same progression for the player, so rule results can be cached by it.
+# The versions are kept on the state by version key, apart from prog_items so copying a state doesn't copy them.
+# ManualWorld.collect/remove drop the versions of the keys an item changes, a key without a version gets a new one from
+# this counter when it is read, so a copied state or one from another process starts with new versions.
+state_version_key = "__Manual State Version__"
+state_versions = itertools.count(1)
+
+class ProcessLocal(dict):
+    """Dict kept on the states, holding entries only valid in this process. It is pickled (and copied) empty."""
+    __slots__ = ()
+
+    def __reduce__(self):
+        return type(self), ()
+
+def get_state_versions(state: CollectionState, player: int) -> dict[str, int]:
+    """The versions of the player's progression in the state, by version key."""
+    try:
+        versions = state.manual_versions
+    except AttributeError:
+        versions = state.manual_versions = ProcessLocal()
+    player_versions = versions.get(player)
+    if player_versions is None:
+        player_versions = versions[player] = {}
+    return player_versions
+
+# ManualWorld.collect/remove also count every progression item of the player in the state under this key,
+# checked against the minimum number of items each rule needs before evaluating it (see RuleCompiler.set_minimum_items).
+progression_count_key = "__Manual Progression Count__"
+
+# Rules reading the same items share a dependency class (see RuleCompiler.build_dependency_index). Each class has its own
+# version key, only dropped when one of its items is collected or removed, so the other rules keep their cached results.
+dependency_classes = itertools.count()
+
+def rule_version_key(dependency_class: int) -> str:
+    return f"__Manual Rule Version {dependency_class}__"
+
+# ManualWorld.collect/remove also keep, for every category, the number of collected items and of distinct collected items
+# directly in state.prog_items under these keys, so they are copied along with the state.
+def category_count_key(category: str) -> str:
+    return f"__Manual Category Count {category}__"
+
+def category_distinct_key(category: str) -> str:
+    return f"__Manual Category Distinct {category}__"
+
+item_name_to_category_keys: dict[str, tuple[tuple[str, str], ...]] = {}
+
+for item in item_table:
+    categories = dict.fromkeys(item.get("category", []))  # keeps the order, drops duplicates
+    if categories:
+        item_name_to_category_keys[item["name"]] = tuple((category_count_key(c), category_distinct_key(c)) for c in categories)
+
+# Likewise, the total collected worth of every value of the items' "value" dicts (see ItemValue in hooks/Rules.py),
+# value names being lowercased and stripped like in the has_{value}_value item groups.
+def item_value_key(value: str) -> str:
+    return f"__Manual Item Value {value.lower().strip()}__"
+
+item_name_to_value_weights: dict[str, tuple[tuple[str, int], ...]] = {}
+
+for item in item_table:
+    weights: dict[str, int] = {}
+    for v, weight in item.get("value", {}).items():
+        key = item_value_key(v)
+        weights[key] = weights.get(key, 0) + int(weight)
+    weights = {key: weight for key, weight in weights.items() if weight}
+    if weights:
+        item_name_to_value_weights[item["name"]] = tuple(weights.items())
+
+# The classification of every item, so creating an item doesn't derive it again for every copy
+def get_item_classification(item: dict) -> ItemClassification:
+    classification = ItemClassification.filler
+
+    if "trap" in item and item["trap"]:
+        classification = ItemClassification.trap
+
+    if "useful" in item and item["useful"]:
+        classification = ItemClassification.useful
+
+    if "progression" in item and item["progression"]:
+        classification = ItemClassification.progression
+
+    if "progression_skip_balancing" in item and item["progression_skip_balancing"]:
+        classification = ItemClassification.progression_skip_balancing
+
+    return classification
+
+item_name_to_classification: dict[str, ItemClassification] = {item["name"]: get_item_classification(item) for item in item_table}
+
+
 ######################
 # Item classes
 ######################
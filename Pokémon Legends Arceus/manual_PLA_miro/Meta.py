@@ -68,4 +68,13 @@ world_description: str = set_world_description("""
     """)
 world_webworld: ManualWeb = set_world_webworld(ManualWeb())
 
-enable_region_diagram = bool(meta_table.get("enable_region_diagram", False))
\ No newline at end of file
+enable_region_diagram = bool(meta_table.get("enable_region_diagram", False))
+# lowers the rules into numpy array operations evaluated for every location and region at once, see BatchRules.py
+enable_batch_rules = bool(meta_table.get("enable_batch_rules", False))
+# counts the calls, results, cache hits and time of every location/region rule, reported in the log and the spoiler
+enable_rule_profiler = bool(meta_table.get("enable_rule_profiler", False))
+# turns the progression items of the pool that no location or region requires into useful items, listed in the spoiler
+enable_progression_demotion = bool(meta_table.get("enable_progression_demotion", False))
+# also runs the legacy requires checkers on every shadow_rules_sample-th call of each rule and logs where they disagree with the compiled rules
+enable_shadow_rules = bool(meta_table.get("enable_shadow_rules", False))
+shadow_rules_sample = int(meta_table.get("shadow_rules_sample", 100))
@@ -0,0 +1,951 @@
+from typing import TYPE_CHECKING, Optional, Union
+from BaseClasses import CollectionState
+from .Helpers import clamp
+from .Items import ProcessLocal, category_count_key, dependency_classes, get_state_versions, progression_count_key, rule_version_key, state_version_key, state_versions
+from .hooks import Rules
+
+import logging
+import math
+import re
+
+if TYPE_CHECKING:
+    from . import ManualWorld
+
+######################
+# Requires tokenizer
+######################
+
+# One alternative per token type, tried in order at every position of the requires string.
+# AND and OR share the same precedence and are left associative, like the original postfix evaluator.
+_token_regex = re.compile(r"""
+    \s*(?:
+        (?P<require>\|[^|]+\|)
+      | (?P<function>\{(?P<func_name>\w+)\((?P<func_args>[^)]*)\)\})
+      | (?P<and>\bAND\b)
+      | (?P<or>\bOR\b)
+      | (?P<not>!)
+      | (?P<open>\()
+      | (?P<close>\))
+      | (?P<constant>[01])
+    )""", re.IGNORECASE | re.VERBOSE)
+
+_unknown_text_regex = re.compile(r"\s*([^\s|{}()!]+|\S)")
+
+def tokenize(requires: str, area_name: str) -> list[tuple[str, re.Match]]:
+    """Split a requires string into (token type, match) pairs."""
+    tokens = []
+    position = 0
+    end = len(requires.rstrip())
+
+    while position < end:
+        match = _token_regex.match(requires, position)
+        if match is None:
+            # the postfix evaluator silently ignored any other text, so only warn about it
+            match = _unknown_text_regex.match(requires, position)
+            logging.warning("Ignoring unknown text '{}' in the requires of location/region {}.".format(match.group(1), area_name))
+        else:
+            tokens.append((match.lastgroup, match))
+        position = match.end()
+
+    return tokens
+
+def parse_count(count: str, item_name: str, area_name: str) -> Union[int, str]:
+    """Numeric counts are converted right away, 'all', 'half' and 'N%' are kept as-is to be resolved against the item pool."""
+    count = count.strip()
+    lowered = count.lower()
+
+    if lowered in ("all", "half"):
+        return lowered
+    if lowered.endswith('%') and len(lowered) > 1:
+        try:
+            float(lowered[:-1])
+        except ValueError as e:
+            raise ValueError(f"Invalid item count `{item_name}` in {area_name}.") from e
+        return lowered
+
+    try:
+        return int(count)
+    except ValueError as e:
+        raise ValueError(f"Invalid item count `{item_name}` in {area_name}.") from e
+
+def resolve_count(count: Union[int, str], available: int) -> int:
+    """Turn a count from parse_count into a number of items, given how many of them exist in the pool."""
+    if isinstance(count, int):
+        return count
+    if count == 'all':
+        return available
+    if count == 'half':
+        return int(available / 2)
+
+    percent = clamp(float(count[:-1]) / 100, 0, 1)
+    return math.ceil(available * percent)
+
+######################
+# Expression tree
+######################
+
+class RequiresNode:
+    """Base class of the compiled requires expression tree. Nodes are immutable once built, except the expression of a
+    CompiledRule or FoldedCall: every use of those is the same node, so RuleCompiler swaps their expression in place when it
+    shares subexpressions (share_common_subexpressions), reorders operands (reorder_operands) or refolds a call (FoldedCall.refold).
+    The repr of a node is its normalized requires string, so equal expressions have equal reprs."""
+    __slots__ = ()
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        raise NotImplementedError
+
+    def operands(self) -> tuple["RequiresNode", ...]:
+        return ()
+
+    def dependencies(self) -> tuple[str, ...]:
+        """The item names this node reads from the state, not counting its operands."""
+        return ()
+
+def walk(node: RequiresNode):
+    """Yields the node and every node below it."""
+    yield node
+    for operand in node.operands():
+        yield from walk(operand)
+
+class Constant(RequiresNode):
+    __slots__ = ("value",)
+
+    def __init__(self, value: bool):
+        self.value = value
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        return self.value
+
+    def __repr__(self):
+        return "1" if self.value else "0"
+
+class HasItem(RequiresNode):
+    """|Item| or |Item:count|. The threshold is the count as a number of items, see RuleCompiler.resolve_thresholds."""
+    __slots__ = ("item", "count", "threshold")
+
+    def __init__(self, item: str, count: Union[int, str]):
+        self.item = item
+        self.count = count
+        self.threshold: Optional[int] = count if isinstance(count, int) else None
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        threshold = self.threshold
+        if threshold is None:
+            threshold = self.resolve(compiler.world.get_item_counts())
+
+        return state.count(self.item, compiler.player) >= threshold
+
+    def resolve(self, item_counts: dict[str, int]) -> int:
+        self.threshold = resolve_count(self.count, item_counts.get(self.item, 0))
+        return self.threshold
+
+    def dependencies(self) -> tuple[str, ...]:
+        return (self.item,)
+
+    def __repr__(self):
+        return f"|{self.item}:{self.count}|"
+
+class HasCategory(RequiresNode):
+    """|@Category| or |@Category:count|, items holds every item name of the category.
+    The state is checked through the category tally kept by ManualWorld.collect/remove."""
+    __slots__ = ("category", "count", "items", "key", "threshold")
+
+    def __init__(self, category: str, count: Union[int, str], items: tuple[str, ...]):
+        self.category = category
+        self.count = count
+        self.items = items
+        self.key = category_count_key(category)
+        self.threshold: Optional[int] = count if isinstance(count, int) else None
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        # a category without any item can never be satisfied, even with a count of 0
+        if not self.items:
+            return False
+
+        threshold = self.threshold
+        if threshold is None:
+            threshold = self.resolve(compiler.world.get_item_counts())
+
+        return state.prog_items[compiler.player][self.key] >= threshold
+
+    def resolve(self, item_counts: dict[str, int]) -> int:
+        self.threshold = resolve_count(self.count, sum(item_counts.get(item, 0) for item in self.items))
+        return self.threshold
+
+    def dependencies(self) -> tuple[str, ...]:
+        return self.items
+
+    def __repr__(self):
+        return f"|@{self.category}:{self.count}|"
+
+class CallFunction(RequiresNode):
+    """{function(args)}, calling a function from hooks/Rules.py. A string result is compiled and evaluated as a requires string.
+    If the function declares the items it reads with @reads, reads holds their names and its results are remembered on the state."""
+    __slots__ = ("function", "args", "area_name", "reads", "version_key")
+
+    # results remembered on each state before they are dropped, for the states that collect many items
+    max_remembered_results = 1024
+
+    def __init__(self, function, args: tuple[str, ...], area_name: str, reads: Optional[tuple[str, ...]] = None):
+        self.function = function
+        self.args = args
+        self.area_name = area_name
+        self.reads = reads
+        # like CompiledRule.version_key, until RuleCompiler.build_dependency_index gives the call the class of the items it reads
+        self.version_key = state_version_key
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        if self.reads is None:
+            return self.call(state, compiler)
+
+        # kept on the state itself, so a copy of the state starts without them and they are dropped along with it
+        remembered = getattr(state, "manual_function_results", None)
+        if remembered is None:
+            remembered = state.manual_function_results = ProcessLocal()
+        versions = get_state_versions(state, compiler.player)
+        version = versions.get(self.version_key)
+        if version is None:
+            version = versions[self.version_key] = next(state_versions)
+        key = (compiler.player, self.function, self.args, version)
+        result = remembered.get(key)
+        if result is None:
+            if len(remembered) >= self.max_remembered_results:
+                remembered.clear()
+            result = remembered[key] = self.call(state, compiler)
+        return result
+
+    def call(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        result = self.function(compiler.world, compiler.multiworld, state, compiler.player, *self.args)
+        if isinstance(result, bool):
+            return result
+
+        return compiler.compile_string(str(result), self.area_name).evaluate(state, compiler)
+
+    def dependencies(self) -> tuple[str, ...]:
+        return self.reads or ()
+
+    def __repr__(self):
+        return "{%s(%s)}" % (self.function.__name__, ",".join(self.args))
+
+class FoldedCall(RequiresNode):
+    """{function(args)} calling a @state_independent function from hooks/Rules.py. The function is called when the rule is compiled
+    and its result is compiled in its place, see RuleCompiler.fold_call. It keeps the call as its repr, since refolding it can change the result.
+    result is the normalized requires string of the result, to tell when a new call changes it."""
+    __slots__ = ("function", "args", "area_name", "expression", "result")
+
+    def __init__(self, function, args: tuple[str, ...], area_name: str, expression: Optional[RequiresNode]):
+        self.function = function
+        self.args = args
+        self.area_name = area_name
+        self.expression = expression
+        self.result = repr(expression) if expression is not None else None
+
+    def refold(self, expression: RequiresNode):
+        """Swaps in the compiled result of a new call, for every rule using the call since they all share this node."""
+        self.expression = expression
+        self.result = repr(expression)
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        return self.expression.evaluate(state, compiler)
+
+    def operands(self) -> tuple[RequiresNode, ...]:
+        return (self.expression,)
+
+    def __repr__(self):
+        return "{%s(%s)}" % (self.function.__name__, ",".join(self.args))
+
+class Not(RequiresNode):
+    __slots__ = ("child",)
+
+    def __init__(self, child: RequiresNode):
+        self.child = child
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        return not self.child.evaluate(state, compiler)
+
+    def operands(self) -> tuple[RequiresNode, ...]:
+        return (self.child,)
+
+    def with_operands(self, operands: tuple[RequiresNode, ...]) -> "Not":
+        return Not(operands[0])
+
+    def __repr__(self):
+        return f"!{self.child!r}"
+
+class And(RequiresNode):
+    __slots__ = ("children",)
+
+    def __init__(self, children: tuple[RequiresNode, ...]):
+        self.children = children
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        # stop at the first false operand, the remaining ones (and their function calls) can't change the result
+        for child in self.children:
+            if not child.evaluate(state, compiler):
+                return False
+        return True
+
+    def operands(self) -> tuple[RequiresNode, ...]:
+        return self.children
+
+    def with_operands(self, operands: tuple[RequiresNode, ...]) -> "And":
+        return And(operands)
+
+    def __repr__(self):
+        return "(" + " AND ".join(repr(child) for child in self.children) + ")"
+
+class Or(RequiresNode):
+    __slots__ = ("children",)
+
+    def __init__(self, children: tuple[RequiresNode, ...]):
+        self.children = children
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        # stop at the first true operand
+        for child in self.children:
+            if child.evaluate(state, compiler):
+                return True
+        return False
+
+    def operands(self) -> tuple[RequiresNode, ...]:
+        return self.children
+
+    def with_operands(self, operands: tuple[RequiresNode, ...]) -> "Or":
+        return Or(operands)
+
+    def __repr__(self):
+        return "(" + " OR ".join(repr(child) for child in self.children) + ")"
+
+class HasAllCounts(RequiresNode):
+    """The |Item:count| operands of an AND, checked in a single pass over the state's items like CollectionState.has_all_counts."""
+    __slots__ = ("leaves", "item_counts")
+
+    def __init__(self, leaves: tuple[HasItem, ...]):
+        self.leaves = leaves
+        self.item_counts = tuple((leaf.item, leaf.threshold) for leaf in leaves)
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        prog_items = state.prog_items[compiler.player]
+        for item, count in self.item_counts:
+            if prog_items[item] < count:
+                return False
+        return True
+
+    def dependencies(self) -> tuple[str, ...]:
+        return tuple(leaf.item for leaf in self.leaves)
+
+    def __repr__(self):
+        return "(" + " AND ".join(repr(leaf) for leaf in self.leaves) + ")"
+
+class HasAnyCount(RequiresNode):
+    """The |Item:count| operands of an OR, checked in a single pass over the state's items like CollectionState.has_any_count."""
+    __slots__ = ("leaves", "item_counts")
+
+    def __init__(self, leaves: tuple[HasItem, ...]):
+        self.leaves = leaves
+        self.item_counts = tuple((leaf.item, leaf.threshold) for leaf in leaves)
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        prog_items = state.prog_items[compiler.player]
+        for item, count in self.item_counts:
+            if prog_items[item] >= count:
+                return True
+        return False
+
+    def dependencies(self) -> tuple[str, ...]:
+        return tuple(leaf.item for leaf in self.leaves)
+
+    def __repr__(self):
+        return "(" + " OR ".join(repr(leaf) for leaf in self.leaves) + ")"
+
+def all_of(nodes: list[RequiresNode]) -> RequiresNode:
+    nodes = [node for node in nodes if not (isinstance(node, Constant) and node.value)]
+    if not nodes:
+        return Constant(True)
+    return nodes[0] if len(nodes) == 1 else And(tuple(nodes))
+
+def any_of(nodes: list[RequiresNode]) -> RequiresNode:
+    if any(isinstance(node, Constant) and node.value for node in nodes):
+        return Constant(True)
+    if not nodes:
+        return Constant(False)
+    return nodes[0] if len(nodes) == 1 else Or(tuple(nodes))
+
+def batch_item_checks(node: RequiresNode) -> RequiresNode:
+    """Replaces the plain |Item:count| operands of every AND/OR with a single HasAllCounts/HasAnyCount operand."""
+    if not node.operands() or isinstance(node, FoldedCall):
+        return node  # the result of a call is compiled, and batched, on its own
+
+    operands = [batch_item_checks(operand) for operand in node.operands()]
+    if isinstance(node, (And, Or)):
+        counted = [operand for operand in operands if isinstance(operand, HasItem) and isinstance(operand.count, int)]
+        if len(counted) > 1:
+            batched = (HasAllCounts if isinstance(node, And) else HasAnyCount)(tuple(counted))
+            # the batched check takes the place of the first of its items
+            first = operands.index(counted[0])
+            operands = operands[:first] + [batched] + [operand for operand in operands[first:] if operand not in counted]
+            if len(operands) == 1:
+                return batched
+    return node.with_operands(tuple(operands))
+
+######################
+# Compiled rules
+######################
+
+def estimate_cost(node: RequiresNode) -> int:
+    """A rough cost of evaluating a node, in state lookups."""
+    if isinstance(node, CallFunction):
+        return 20
+    if isinstance(node, (HasAllCounts, HasAnyCount)):
+        return len(node.item_counts)
+    if isinstance(node, CompiledRule) and node.cacheable:
+        return 2  # usually answered from its cache
+    return max(1, sum(estimate_cost(operand) for operand in node.operands()))
+
+def is_cacheable(expression: RequiresNode) -> bool:
+    # functions from hooks/Rules.py can look at anything in the state, so their result can't be cached by version,
+    # unless they declare what they read with @reads
+    return not any(isinstance(node, CallFunction) and node.reads is None for node in walk(expression))
+
+def calls_functions(expression: RequiresNode) -> bool:
+    return any(isinstance(node, CallFunction) for node in walk(expression))
+
+def necessary_counts(node: RequiresNode) -> dict[str, tuple[int, tuple[str, ...]]]:
+    """The counts every state passing the node has, by item name or @category: the threshold and the item names it counts."""
+    if isinstance(node, HasItem):
+        return {node.item: (node.threshold or 0, (node.item,))}
+    if isinstance(node, HasCategory):
+        return {"@" + node.category: (node.threshold or 0, node.items)} if node.items else {}
+    if isinstance(node, (CompiledRule, FoldedCall)):
+        return necessary_counts(node.expression)
+
+    if isinstance(node, (And, HasAllCounts)):
+        counts = {}
+        for child in (node.children if isinstance(node, And) else node.leaves):
+            for key, (count, items) in necessary_counts(child).items():
+                if key not in counts or counts[key][0] < count:
+                    counts[key] = (count, items)
+        return counts
+    if isinstance(node, (Or, HasAnyCount)):
+        # only the counts needed by every operand
+        children = [necessary_counts(child) for child in (node.children if isinstance(node, Or) else node.leaves)]
+        counts = children[0] if children else {}
+        for child in children[1:]:
+            counts = {key: min(needed, child[key], key=lambda counted: counted[0]) for key, needed in counts.items() if key in child}
+        return counts
+    return {}
+
+def minimum_items(node: RequiresNode) -> int:
+    """A lower bound of the number of progression items a state needs to pass the node:
+    the sum of necessary counts over disjoint sets of items, picked greedily from the largest count."""
+    minimum = 0
+    counted: set[str] = set()
+    for key, (count, items) in sorted(necessary_counts(node).items(), key=lambda needed: (-needed[1][0], needed[0])):
+        if count > 0 and counted.isdisjoint(items):
+            minimum += count
+            counted.update(items)
+    return minimum
+
+class CompiledRule(RequiresNode):
+    """The compiled requires shared by every location/region whose requires normalize to the same expression,
+    also used for the subexpressions shared by several rules (see RuleCompiler.share_common_subexpressions).
+    It remembers its last results by the version of its dependency class (see ManualWorld.collect), so the first location
+    evaluated in a state answers for all of the others, and collecting an item the rule doesn't read keeps its results."""
+    __slots__ = ("expression", "cacheable", "results", "version_key", "minimum_items")
+
+    max_cached_results = 16
+
+    def __init__(self, expression: RequiresNode):
+        self.expression = expression
+        self.cacheable = is_cacheable(expression)
+        self.results: dict[int, bool] = {}
+        # until RuleCompiler.build_dependency_index runs, any change to the state is a new version
+        self.version_key = state_version_key
+        # set by RuleCompiler.set_minimum_items
+        self.minimum_items = 0
+
+    def evaluate(self, state: CollectionState, compiler: "RuleCompiler") -> bool:
+        prog_items = state.prog_items[compiler.player]
+        if not self.cacheable:
+            return self.passes(state, prog_items, compiler)
+
+        versions = get_state_versions(state, compiler.player)
+        version = versions.get(self.version_key)
+        if version is None:
+            version = versions[self.version_key] = next(state_versions)
+        result = self.results.get(version)
+        if result is None:
+            if len(self.results) >= self.max_cached_results:
+                self.results.clear()
+            result = self.results[version] = self.passes(state, prog_items, compiler)
+        return result
+
+    def passes(self, state: CollectionState, prog_items, compiler: "RuleCompiler") -> bool:
+        # most rules fail early in fill, a state without enough progression items fails without walking the expression
+        if prog_items[progression_count_key] < self.minimum_items:
+            return False
+        return self.expression.evaluate(state, compiler)
+
+    def operands(self) -> tuple[RequiresNode, ...]:
+        return (self.expression,)
+
+    def __getstate__(self):
+        # the cached results are keyed by the state versions of this process
+        return self.expression, self.cacheable, self.version_key, self.minimum_items
+
+    def __setstate__(self, state):
+        self.expression, self.cacheable, self.version_key, self.minimum_items = state
+        self.results = {}
+
+    def __repr__(self):
+        return repr(self.expression)
+
+######################
+# Compiler
+######################
+
+class RuleCompiler:
+    """Compiles the requires strings of one world into expression trees, once, when the rules are set."""
+
+    # how many access checks are sampled before reordering the operands of the AND/OR nodes, see sample
+    sample_calls = 2000
+
+    def __init__(self, world: "ManualWorld"):
+        self.world = world
+        self.multiworld = world.multiworld
+        self.player = world.player
+        self.compiled_strings: dict[str, RequiresNode] = {}
+        self.category_items: dict[str, tuple[str, ...]] = {}
+        self.rules: dict[str, CompiledRule] = {}
+        self.shared: dict[str, CompiledRule] = {}
+        self.shared_uses: dict[str, int] = {}
+        self.relative_counts: list[Union[HasItem, HasCategory]] = []
+        self.folded_calls: dict[str, FoldedCall] = {}
+        self.compiled_count = 0
+        self.samples_left = 0
+        self.operand_passes: dict[RequiresNode, list[int]] = {}
+        self.operand_samples: dict[RequiresNode, int] = {}
+        self.sampled_calls: dict[RequiresNode, bool] = {}  # AND/OR node -> whether it calls functions, while sampling
+        self.operands_reordered = False
+
+    def compile_rule(self, requires: Union[str, list], area_name: str) -> CompiledRule:
+        """Returns the shared CompiledRule of a location/region requires, in string or dict/list form."""
+        self.compiled_count += 1
+        if isinstance(requires, str):
+            expression = self.compile_string(requires, area_name)
+        else:
+            expression = self.compile_list(requires, area_name)
+        normalized = repr(expression)
+
+        if normalized not in self.rules:
+            self.rules[normalized] = CompiledRule(expression)
+        return self.rules[normalized]
+
+    def share_common_subexpressions(self):
+        """Once every rule is compiled, turns the subexpressions that appear in more than one rule into CompiledRules,
+        so each of them is evaluated at most once per state version no matter how many rules contain it."""
+        normalized: dict[int, str] = {}
+
+        def key(node: RequiresNode) -> str:
+            if id(node) not in normalized:
+                normalized[id(node)] = repr(node)
+            return normalized[id(node)]
+
+        # count the distinct expressions each AND/OR/NOT subexpression is an operand of
+        uses: dict[str, int] = {}
+        visited = set()
+
+        def count_uses(node: RequiresNode):
+            if key(node) in visited:
+                return
+            visited.add(key(node))
+            for operand in node.operands():
+                if operand.operands():  # leaves are a single lookup, cheaper than the cache itself
+                    uses[key(operand)] = uses.get(key(operand), 0) + 1
+                    count_uses(operand)
+
+        for normalized_rule, rule in self.rules.items():
+            uses[normalized_rule] = uses.get(normalized_rule, 0) + 1
+            count_uses(rule.expression)
+
+        rebuilt_calls = set()
+
+        def rebuild(node: RequiresNode) -> RequiresNode:
+            if not node.operands():
+                return node
+            if isinstance(node, FoldedCall):
+                # every use of the call is the same node, so its expression is rebuilt in place, once
+                if id(node) not in rebuilt_calls:
+                    rebuilt_calls.add(id(node))
+                    node.expression = share(node.expression)
+                return node
+            return node.with_operands(tuple(share(operand) for operand in node.operands()))
+
+        def share(node: RequiresNode) -> RequiresNode:
+            node_key = key(node)
+            if not node.operands() or uses.get(node_key, 0) < 2:
+                return rebuild(node)
+
+            if node_key in self.rules:
+                return self.rules[node_key]  # its own expression is rebuilt below
+            if node_key not in self.shared:
+                self.shared[node_key] = CompiledRule(rebuild(node))
+                self.shared_uses[node_key] = uses[node_key]
+            return self.shared[node_key]
+
+        for rule in self.rules.values():
+            rule.expression = rebuild(rule.expression)
+
+        for normalized_rule in self.rules:
+            if uses[normalized_rule] > 1:
+                self.shared_uses[normalized_rule] = uses[normalized_rule]
+
+    def build_dependency_index(self) -> dict[str, tuple[str, ...]]:
+        """Groups the cacheable rules and shared subexpressions by the items they read and gives each group its own version key.
+        Returns the version keys ManualWorld.collect/remove have to drop for each item, every other rule keeps its cached results."""
+        class_keys: dict[frozenset[str], str] = {}
+        index: dict[str, list[str]] = {}
+
+        def class_key(dependencies: frozenset[str]) -> str:
+            if dependencies not in class_keys:
+                # never reuse a key, the states versioned for a previous index may still be around
+                class_keys[dependencies] = rule_version_key(next(dependency_classes))
+                for item in dependencies:
+                    index.setdefault(item, []).append(class_keys[dependencies])
+            return class_keys[dependencies]
+
+        for rule in (*self.rules.values(), *self.shared.values()):
+            # the calls to @reads functions remember their results by the version of the items they read
+            for node in walk(rule.expression):
+                if isinstance(node, CallFunction) and node.reads is not None:
+                    node.version_key = class_key(frozenset(node.reads))
+
+            rule.cacheable = is_cacheable(rule.expression)  # refolded calls can change it
+            if not rule.cacheable:
+                continue
+
+            rule.version_key = class_key(frozenset(item for node in walk(rule.expression) for item in node.dependencies()))
+            rule.results.clear()
+
+        return {item: tuple(keys) for item, keys in index.items()}
+
+    def index_dependencies(self):
+        """Builds the dependency index of the world. The states get versions for its new keys when they are first read."""
+        self.world.dependency_index = self.build_dependency_index()
+        self.set_minimum_items()
+
+    def set_minimum_items(self):
+        """Gives every rule the minimum number of progression items of a state passing it, from its current thresholds."""
+        for rule in (*self.rules.values(), *self.shared.values()):
+            rule.minimum_items = minimum_items(rule.expression)
+
+    def resolve_thresholds(self):
+        """Turns the 'all', 'half' and 'N%' counts of every rule into numbers of items, from the complete item pool.
+        Called at the end of ManualWorld.generate_basic, call it again after ManualWorld.invalidate_item_counts if the pool is changed after that.
+        The @state_independent functions are called again too, as they are likely to look at the pool."""
+        item_counts = self.world.get_item_counts()
+
+        refolded = False
+        for call in self.folded_calls.values():
+            expression = self.call_state_independent(call.function, call.args, call.area_name)
+            if repr(expression) != call.result:
+                call.refold(expression)
+                refolded = True
+
+        for node in self.relative_counts:
+            node.resolve(item_counts)
+        if refolded:
+            self.index_dependencies()  # the new results may read other items
+        else:
+            self.set_minimum_items()
+
+        for rule in (*self.rules.values(), *self.shared.values()):
+            rule.results.clear()
+        if self.world.batch_rules is not None:
+            self.world.batch_rules.lowered = False
+
+        # the first access checks of fill are sampled to pick the order of the AND/OR operands
+        if not self.operands_reordered:
+            self.samples_left = self.sample_calls
+
+    def sample(self, rule: CompiledRule, state: CollectionState):
+        """Counts how often each AND/OR operand of the rule passes for the state, evaluating all the call-free ones.
+        Called by the access rules for the first sample_calls checks after the thresholds are resolved, then the operands are reordered."""
+        self.samples_left -= 1
+        # a cached result means the state was already sampled for this rule
+        if not (rule.cacheable and get_state_versions(state, self.player).get(rule.version_key) in rule.results):
+            self.sample_node(rule.expression, state)
+        if not self.samples_left:
+            self.reorder_operands()
+
+    def sample_node(self, node: RequiresNode, state: CollectionState) -> bool:
+        if isinstance(node, (And, Or)):
+            if node not in self.sampled_calls:
+                self.sampled_calls[node] = calls_functions(node)
+            if self.sampled_calls[node]:
+                # short-circuited like And/Or.evaluate, so no function is called in a state an earlier operand rules out.
+                # Its operands keep their order anyway, only the call-free ones below it are sampled.
+                stop = isinstance(node, Or)
+                for child in node.children:
+                    if self.sample_node(child, state) == stop:
+                        return stop
+                return not stop
+            results = [self.sample_node(child, state) for child in node.children]
+            passes = self.operand_passes.setdefault(node, [0] * len(results))
+            for index, result in enumerate(results):
+                passes[index] += result
+            self.operand_samples[node] = self.operand_samples.get(node, 0) + 1
+            return all(results) if isinstance(node, And) else any(results)
+        if isinstance(node, Not):
+            return not self.sample_node(node.child, state)
+        if isinstance(node, (CompiledRule, FoldedCall)):
+            return self.sample_node(node.expression, state)
+        return node.evaluate(state, self)
+
+    def reorder_operands(self):
+        """Puts the cheap and decisive operands of every AND/OR first: the ones most likely to fail in an AND,
+        or to pass in an OR, for their cost. Operands are pure, so the results are the same, only evaluated faster.
+        The order only depends on the sampled checks and the original order, so it is the same for the same seed."""
+        reordered = 0
+        # the reordered node of every node, by id, so the nodes shared by several rules are still shared afterwards
+        replacements: dict[int, RequiresNode] = {}
+
+        def reorder(node: RequiresNode) -> RequiresNode:
+            nonlocal reordered
+            if id(node) in replacements:
+                return replacements[id(node)]
+
+            replacement = node
+            if isinstance(node, FoldedCall):
+                # every use of the call is the same node, so its expression is reordered in place
+                node.expression = reorder(node.expression)
+            elif node.operands() and not isinstance(node, CompiledRule):  # shared subexpressions are reordered on their own
+                operands = tuple(reorder(operand) for operand in node.operands())
+                # function calls keep their place, in case they rely on it
+                if node in self.operand_samples and not calls_functions(node):
+                    samples = self.operand_samples[node]
+                    passes = self.operand_passes[node]
+
+                    def score(index: int) -> tuple[float, int]:
+                        passing = (passes[index] + 1) / (samples + 2)
+                        decisive = 1 - passing if isinstance(node, And) else passing
+                        return estimate_cost(operands[index]) / decisive, index
+
+                    order = sorted(range(len(operands)), key=score)
+                    if order != list(range(len(operands))):
+                        operands = tuple(operands[index] for index in order)
+                        reordered += 1
+                if any(operand is not original for operand, original in zip(operands, node.operands())):
+                    replacement = node.with_operands(operands)
+
+            replacements[id(node)] = replacement
+            return replacement
+
+        for rule in (*self.rules.values(), *self.shared.values()):
+            rule.expression = reorder(rule.expression)
+
+        self.operand_passes.clear()
+        self.operand_samples.clear()
+        self.sampled_calls.clear()
+        self.operands_reordered = True
+        logging.debug(f"Reordered the operands of {reordered} AND/OR nodes of player {self.player} from {self.sample_calls} sampled access checks.")
+
+    def observed_items(self) -> Optional[set[str]]:
+        """The names of the items read by the compiled rules of the world's locations and regions,
+        or None if any of them calls a function from hooks/Rules.py that is neither @state_independent nor @reads, since it could read any item."""
+        observed = set()
+        for rule in self.rules.values():
+            for node in walk(rule):
+                if isinstance(node, CallFunction) and node.reads is None:
+                    return None
+                observed.update(node.dependencies())
+        return observed
+
+    def dump(self) -> str:
+        """Describes the compiled rules and the subexpressions shared between them, for debugging."""
+        lines = [f"{self.compiled_count} requires compiled into {len(self.rules)} distinct rules, "
+                 f"{len(self.shared_uses)} shared subexpressions:"]
+        for normalized, uses in sorted(self.shared_uses.items(), key=lambda shared: -shared[1]):
+            lines.append(f"  {uses} uses: {normalized}")
+        return "\n".join(lines)
+
+    def compile_string(self, requires: str, area_name: str) -> RequiresNode:
+        """Returns the expression tree of a requires string, raising a KeyError with the area name if it is invalid."""
+        if requires in self.compiled_strings:
+            return self.compiled_strings[requires]
+
+        if requires.strip() == "":
+            node = Constant(True)
+        else:
+            node = batch_item_checks(_Parser(self, tokenize(requires, area_name), requires, area_name).parse())
+
+        self.compiled_strings[requires] = node
+        return node
+
+    def compile_list(self, requires: list, area_name: str) -> RequiresNode:
+        """Returns the expression tree of dict/list form requires: they are met when all of their plain items are,
+        or when all the items of any of their groups are, a group being a list or a dict with an "or" list."""
+        groups = []
+        items = []
+
+        for require in requires:
+            if isinstance(require, list) or (isinstance(require, dict) and "or" in require and isinstance(require["or"], list)):
+                group = require["or"] if isinstance(require, dict) else require
+                groups.append(all_of([self.compile_list_item(item, area_name) for item in group]))
+            else:
+                items.append(self.compile_list_item(require, area_name))
+
+        return batch_item_checks(any_of(groups + [all_of(items)]))
+
+    def compile_list_item(self, item: str, area_name: str) -> HasItem:
+        """"Item" or "Item:count" in dict/list form requires. Unlike the string form, the item name is used as-is."""
+        item_parts = item.split(":")
+        if len(item_parts) == 1:
+            return HasItem(item, 1)
+
+        try:
+            return HasItem(item_parts[0], int(item_parts[1]))
+        except ValueError as e:
+            raise ValueError(f"Invalid item count `{item_parts[0]}` in {area_name}.") from e
+
+    def get_category_items(self, category: str) -> tuple[str, ...]:
+        if category not in self.category_items:
+            self.category_items[category] = tuple(item["name"] for item in self.world.item_name_to_item.values()
+                                                  if "category" in item and category in item["category"])
+        return self.category_items[category]
+
+    def fold_call(self, function, args: tuple[str, ...], area_name: str) -> FoldedCall:
+        """Returns the node of a call to a @state_independent function, every use of the same call shares that node."""
+        call = FoldedCall(function, args, area_name, None)
+        if repr(call) not in self.folded_calls:
+            call.refold(self.call_state_independent(function, args, area_name))
+            self.folded_calls[repr(call)] = call
+        return self.folded_calls[repr(call)]
+
+    def call_state_independent(self, function, args: tuple[str, ...], area_name: str) -> RequiresNode:
+        """Calls a @state_independent function without a state and compiles its result."""
+        result = function(self.world, self.multiworld, None, self.player, *args)
+        if isinstance(result, bool):
+            return Constant(result)
+        return self.compile_string(str(result), area_name)
+
+    def get_function_reads(self, function) -> Optional[tuple[str, ...]]:
+        """The names of the items a function declares it reads with @reads, its categories included, or None if it doesn't."""
+        if not hasattr(function, "reads_items"):
+            return None
+        items = dict.fromkeys(function.reads_items)
+        for category in function.reads_categories:
+            items.update(dict.fromkeys(self.get_category_items(category)))
+        return tuple(items)
+
+    def get_function(self, func_name: str, area_name: str):
+        func = getattr(Rules, func_name, None)
+        if not callable(func):
+            raise KeyError("Invalid logic format for location/region {}: {{{}()}} is not a function in hooks/Rules.py.".format(area_name, func_name))
+        return func
+
+class _Parser:
+    """Recursive descent parser: expression := unary ((AND | OR) unary)*, unary := ! unary | atom."""
+
+    def __init__(self, compiler: RuleCompiler, tokens: list[tuple[str, re.Match]], requires: str, area_name: str):
+        self.compiler = compiler
+        self.tokens = tokens
+        self.requires = requires
+        self.area_name = area_name
+        self.position = 0
+        self.unclosed = 0
+
+    def error(self, reason: str) -> KeyError:
+        return KeyError("Invalid logic format for location/region {}: {} in '{}'.".format(self.area_name, reason, self.requires))
+
+    def peek(self) -> Optional[str]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][0]
+        return None
+
+    def parse(self) -> RequiresNode:
+        node = self.parse_expression()
+        if self.position < len(self.tokens):
+            raise self.error("unexpected '{}'".format(self.tokens[self.position][1].group().strip()))
+        if self.unclosed:
+            # the postfix evaluator closed any parenthesis left open at the end of the string, so keep accepting it
+            logging.warning("Location/region {} is missing {} closing parenthesis in its requires.".format(self.area_name, self.unclosed))
+        return node
+
+    def parse_expression(self) -> RequiresNode:
+        node = self.parse_unary()
+
+        while self.peek() in ("and", "or"):
+            operator = And if self.peek() == "and" else Or
+            self.position += 1
+            right = self.parse_unary()
+
+            # chains of the same operator become a single node, mixed operators nest from the left
+            if type(node) is operator:
+                node = operator(node.children + (right,))
+            else:
+                node = operator((node, right))
+
+        return node
+
+    def parse_unary(self) -> RequiresNode:
+        if self.peek() == "not":
+            self.position += 1
+            return Not(self.parse_unary())
+        return self.parse_atom()
+
+    def parse_atom(self) -> RequiresNode:
+        token_type = self.peek()
+        if token_type is None:
+            raise self.error("unexpected end of requires")
+
+        match = self.tokens[self.position][1]
+        self.position += 1
+
+        if token_type == "open":
+            node = self.parse_expression()
+            if self.peek() == "close":
+                self.position += 1
+            elif self.peek() is None:
+                self.unclosed += 1
+            else:
+                raise self.error("expected ')'")
+            return node
+
+        if token_type == "require":
+            return self.parse_require(match.group("require"))
+
+        if token_type == "function":
+            func_args = match.group("func_args").split(",")
+            if func_args == ['']:
+                func_args.pop()
+            func = self.compiler.get_function(match.group("func_name"), self.area_name)
+            if getattr(func, "state_independent", False):
+                return self.compiler.fold_call(func, tuple(func_args), self.area_name)
+            return CallFunction(func, tuple(func_args), self.area_name, self.compiler.get_function_reads(func))
+
+        if token_type == "constant":
+            return Constant(match.group("constant") == "1")
+
+        raise self.error("unexpected '{}'".format(match.group().strip()))
+
+    def parse_require(self, token: str) -> RequiresNode:
+        is_category = token.startswith('|@')
+        item = token.lstrip('|@$').rstrip('|')
+
+        item_parts = item.split(":")
+        item_name = item
+        item_count: Union[int, str] = 1
+
+        if len(item_parts) > 1:
+            item_name = item_parts[0].strip()
+            item_count = parse_count(item_parts[1], item_name, self.area_name)
+
+        if is_category:
+            node = HasCategory(item_name, item_count, self.compiler.get_category_items(item_name))
+        else:
+            node = HasItem(item_name, item_count)
+
+        if node.threshold is None:
+            self.compiler.relative_counts.append(node)
+        return node
@@ -0,0 +1,71 @@
+from typing import Callable
+from BaseClasses import CollectionState
+from .RuleCompiler import CompiledRule
+
+import time
+
+class RuleStats:
+    """Counters of one compiled rule, shared by every location/region using it."""
+    __slots__ = ("expression", "areas", "calls", "true", "cache_hits", "time")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.areas: list[str] = []
+        self.calls = 0
+        self.true = 0
+        self.cache_hits = 0
+        self.time = 0  # in nanoseconds
+
+    def describe(self) -> str:
+        calls = max(self.calls, 1)
+        areas = ", ".join(self.areas[:3]) + (f" and {len(self.areas) - 3} more" if len(self.areas) > 3 else "")
+        return (f"{self.time / 1e6:.2f}ms, {self.calls} calls, {self.true * 100 // calls}% true, "
+                f"{self.cache_hits * 100 // calls}% cached: {self.expression} ({areas})")
+
+class ProfiledRule:
+    """Access rule counting the calls to another one, installed instead of it when enable_rule_profiler is set in meta.json."""
+    __slots__ = ("rule", "stats")
+
+    def __init__(self, rule: Callable[[CollectionState], bool], stats: RuleStats):
+        self.rule = rule
+        self.stats = stats
+
+    def __call__(self, state: CollectionState) -> bool:
+        stats = self.stats
+        stats.calls += 1
+        if self.rule.is_cached(state):
+            stats.cache_hits += 1
+
+        start = time.perf_counter_ns()
+        result = self.rule(state)
+        stats.time += time.perf_counter_ns() - start
+
+        if result:
+            stats.true += 1
+        return result
+
+    def is_cached(self, state: CollectionState) -> bool:
+        return self.rule.is_cached(state)
+
+class RuleProfiler:
+    """Collects the RuleStats of a world's access rules and reports the ones taking the most time."""
+
+    def __init__(self):
+        self.stats: dict[CompiledRule, RuleStats] = {}
+
+    def wrap(self, rule: Callable[[CollectionState], bool], area_name: str) -> ProfiledRule:
+        if rule.rule not in self.stats:
+            self.stats[rule.rule] = RuleStats(repr(rule.rule))
+        self.stats[rule.rule].areas.append(area_name)
+        return ProfiledRule(rule, self.stats[rule.rule])
+
+    def report(self) -> list[RuleStats]:
+        return sorted(self.stats.values(), key=lambda stats: (-stats.time, -stats.calls, stats.expression))
+
+    def summary(self, limit: int = 0) -> str:
+        report = self.report()
+        total_time = sum(stats.time for stats in report)
+        total_calls = sum(stats.calls for stats in report)
+        lines = [f"{total_calls} access rule calls taking {total_time / 1e6:.1f}ms over {len(report)} rules:"]
+        lines += ["  " + stats.describe() for stats in (report[:limit] if limit else report)]
+        return "\n".join(lines)
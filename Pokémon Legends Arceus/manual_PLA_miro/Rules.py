@@ -1,12 +1,19 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable, Optional
 from worlds.generic.Rules import set_rule
 from .Regions import regionMap
+from .Locations import location_name_to_location
+from .RuleCompiler import CompiledRule, RuleCompiler, walk
+from .Items import get_state_versions, state_version_key
+from .BatchRules import BatchRules, numpy_loaded
+from .RuleProfiler import RuleProfiler
+from .Meta import enable_batch_rules, enable_rule_profiler, enable_shadow_rules, shadow_rules_sample
 from .hooks import Rules
-from BaseClasses import MultiWorld, CollectionState
-from .Helpers import clamp, is_item_enabled
+from .Helpers import clamp
+from BaseClasses import MultiWorld, CollectionState, Item
 
-import re
+import logging
 import math
+import re
 
 if TYPE_CHECKING:
     from . import ManualWorld
@@ -64,200 +71,341 @@ def evaluate_postfix(expr: str, location: str) -> bool:
         raise KeyError("Invalid logic format for location/region {}.".format(location))
     return stack.pop()
 
-def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
-    # this is only called when the area (think, location or region) has a "requires" field that is a string
-    def checkRequireStringForArea(state: CollectionState, area: dict):
-        requires_list = area["requires"]
-        # Generate item_counts here so it can be access each time this is called
-        if player not in world.item_counts:
-            real_pool = multiworld.get_items()
-            world.item_counts[player] = {i.name: real_pool.count(i) for i in real_pool if i.player == player}
-
-        # fallback if items_counts[player] not present (will not be accurate to hooks item count)
-        items_counts = world.get_item_counts()
-
-        if requires_list == "":
-            return True
-
-        for item in re.findall(r'\{(\w+)\(([^)]*)\)\}', requires_list):
-            func_name = item[0]
-            func_args = item[1].split(",")
-            if func_args == ['']:
-                func_args.pop()
-            func = getattr(Rules, func_name)
-            result = func(world, multiworld, state, player, *func_args)
-            if isinstance(result, bool):
-                requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", "1" if result else "0")
+# The legacy requires checkers, which substitute the requires string and evaluate it for every call.
+# They are only used by the shadow rules (enable_shadow_rules in meta.json) to cross-check the compiled rules.
+
+# this is only called when the area (think, location or region) has a "requires" field that is a string
+def checkRequireStringForArea(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int, area: dict):
+    requires_list = area["requires"]
+    items_counts = world.get_item_counts(player)
+
+    if requires_list == "":
+        return True
+
+    for item in re.findall(r'\{(\w+)\(([^)]*)\)\}', requires_list):
+        func_name = item[0]
+        func_args = item[1].split(",")
+        if func_args == ['']:
+            func_args.pop()
+        func = getattr(Rules, func_name)
+        result = func(world, multiworld, state, player, *func_args)
+        if isinstance(result, bool):
+            requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", "1" if result else "0")
+        else:
+            requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", str(result))
+
+    # parse user written statement into list of each item
+    for item in re.findall(r'\|[^|]+\|', requires_list):
+        require_type = 'item'
+
+        if '|@' in item:
+            require_type = 'category'
+
+        item_base = item
+        item = item.lstrip('|@$').rstrip('|')
+
+        item_parts = item.split(":")  # type: list[str]
+        item_name = item
+        item_count = "1"
+
+        if len(item_parts) > 1:
+            item_name = item_parts[0].strip()
+            item_count = item_parts[1].strip()
+
+        total = 0
+
+        if require_type == 'category':
+            category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
+            category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
+            if item_count.lower() == 'all':
+                item_count = category_items_counts
+            elif item_count.lower() == 'half':
+                item_count = int(category_items_counts / 2)
+            elif item_count.endswith('%') and len(item_count) > 1:
+                percent = clamp(float(item_count[:-1]) / 100, 0, 1)
+                item_count = math.ceil(category_items_counts * percent)
             else:
-                requires_list = requires_list.replace("{" + func_name + "(" + item[1] + ")}", str(result))
-
-
-        # parse user written statement into list of each item
-        for item in re.findall(r'\|[^|]+\|', requires_list):
-            require_type = 'item'
-
-            if '|@' in item:
-                require_type = 'category'
-
-            item_base = item
-            item = item.lstrip('|@$').rstrip('|')
-
-            item_parts = item.split(":")  # type: list[str]
-            item_name = item
-            item_count = "1"
-
-
-            if len(item_parts) > 1:
-                item_name = item_parts[0].strip()
-                item_count = item_parts[1].strip()
-
-            total = 0
-
-            if require_type == 'category':
-                category_items = [item for item in world.item_name_to_item.values() if "category" in item and item_name in item["category"]]
-                category_items_counts = sum([items_counts.get(category_item["name"], 0) for category_item in category_items])
-                if item_count.lower() == 'all':
-                    item_count = category_items_counts
-                elif item_count.lower() == 'half':
-                    item_count = int(category_items_counts / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(category_items_counts * percent)
-                else:
-                    try:
-                        item_count = int(item_count)
-                    except ValueError as e:
-                        raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
-
-                for category_item in category_items:
-                    total += state.count(category_item["name"], player)
-
-                    if total >= item_count:
-                        requires_list = requires_list.replace(item_base, "1")
-            elif require_type == 'item':
-                item_current_count = items_counts.get(item_name, 0)
-                if item_count.lower() == 'all':
-                    item_count = item_current_count
-                elif item_count.lower() == 'half':
-                    item_count = int(item_current_count / 2)
-                elif item_count.endswith('%') and len(item_count) > 1:
-                    percent = clamp(float(item_count[:-1]) / 100, 0, 1)
-                    item_count = math.ceil(item_current_count * percent)
-                else:
+                try:
                     item_count = int(item_count)
+                except ValueError as e:
+                    raise ValueError(f"Invalid item count `{item_name}` in {area}.") from e
 
-                total = state.count(item_name, player)
+            for category_item in category_items:
+                total += state.count(category_item["name"], player)
 
                 if total >= item_count:
                     requires_list = requires_list.replace(item_base, "1")
+        elif require_type == 'item':
+            item_current_count = items_counts.get(item_name, 0)
+            if item_count.lower() == 'all':
+                item_count = item_current_count
+            elif item_count.lower() == 'half':
+                item_count = int(item_current_count / 2)
+            elif item_count.endswith('%') and len(item_count) > 1:
+                percent = clamp(float(item_count[:-1]) / 100, 0, 1)
+                item_count = math.ceil(item_current_count * percent)
+            else:
+                item_count = int(item_count)
 
-            if total <= item_count:
-                requires_list = requires_list.replace(item_base, "0")
+            total = state.count(item_name, player)
 
-        requires_list = re.sub(r'\s?\bAND\b\s?', '&', requires_list, 0, re.IGNORECASE)
-        requires_list = re.sub(r'\s?\bOR\b\s?', '|', requires_list, 0, re.IGNORECASE)
+            if total >= item_count:
+                requires_list = requires_list.replace(item_base, "1")
 
-        requires_string = infix_to_postfix("".join(requires_list), area)
-        return (evaluate_postfix(requires_string, area))
+        if total <= item_count:
+            requires_list = requires_list.replace(item_base, "0")
 
-    # this is only called when the area (think, location or region) has a "requires" field that is a dict
-    def checkRequireDictForArea(state: CollectionState, area: dict):
-        canAccess = True
+    requires_list = re.sub(r'\s?\bAND\b\s?', '&', requires_list, 0, re.IGNORECASE)
+    requires_list = re.sub(r'\s?\bOR\b\s?', '|', requires_list, 0, re.IGNORECASE)
 
-        for item in area["requires"]:
-            # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
-            if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
-                canAccessOr = True
-                or_items = item
+    requires_string = infix_to_postfix("".join(requires_list), area)
+    return (evaluate_postfix(requires_string, area))
 
-                if isinstance(item, dict):
-                    or_items = item["or"]
+# this is only called when the area (think, location or region) has a "requires" field that is a dict
+def checkRequireDictForArea(state: CollectionState, player: int, area: dict):
+    canAccess = True
 
-                for or_item in or_items:
-                    or_item_parts = or_item.split(":")
-                    or_item_name = or_item
-                    or_item_count = 1
+    for item in area["requires"]:
+        # if the require entry is an object with "or" or a list of items, treat it as a standalone require of its own
+        if (isinstance(item, dict) and "or" in item and isinstance(item["or"], list)) or (isinstance(item, list)):
+            canAccessOr = True
+            or_items = item
 
-                    if len(or_item_parts) > 1:
-                        or_item_name = or_item_parts[0]
-                        or_item_count = int(or_item_parts[1])
+            if isinstance(item, dict):
+                or_items = item["or"]
 
-                    if not state.has(or_item_name, player, or_item_count):
-                        canAccessOr = False
+            for or_item in or_items:
+                or_item_parts = or_item.split(":")
+                or_item_name = or_item
+                or_item_count = 1
 
-                if canAccessOr:
-                    canAccess = True
-                    break
-            else:
-                item_parts = item.split(":")
-                item_name = item
-                item_count = 1
+                if len(or_item_parts) > 1:
+                    or_item_name = or_item_parts[0]
+                    or_item_count = int(or_item_parts[1])
 
-                if len(item_parts) > 1:
-                    item_name = item_parts[0]
-                    item_count = int(item_parts[1])
+                if not state.has(or_item_name, player, or_item_count):
+                    canAccessOr = False
 
-                if not state.has(item_name, player, item_count):
-                    canAccess = False
+            if canAccessOr:
+                canAccess = True
+                break
+        else:
+            item_parts = item.split(":")
+            item_name = item
+            item_count = 1
 
-        return canAccess
+            if len(item_parts) > 1:
+                item_name = item_parts[0]
+                item_count = int(item_parts[1])
+
+            if not state.has(item_name, player, item_count):
+                canAccess = False
+
+    return canAccess
+
+def legacyLocationOrRegionCheck(world: "ManualWorld", multiworld: MultiWorld, state: CollectionState, player: int, area: dict):
+    if isinstance(area["requires"], str):
+        return checkRequireStringForArea(world, multiworld, state, player, area)
+    else:  # item access is in dict form
+        return checkRequireDictForArea(state, player, area)
+
+# The access rules are top-level classes holding only their compiled rule and player, the world is looked up from the state
+# on the first call. Unlike closures over the world, they can be pickled, with their world or on their own.
+class RequiresRule:
+    """Access rule of the locations/regions whose requires compiled into the same rule."""
+    __slots__ = ("rule", "player", "compiler")
+
+    def __init__(self, rule: CompiledRule, player: int):
+        self.rule = rule
+        self.player = player
+        self.compiler = None
+
+    def __call__(self, state: CollectionState) -> bool:
+        compiler = self.compiler
+        if compiler is None:
+            compiler = self.compiler = state.multiworld.worlds[self.player].rule_compiler
+        if compiler.samples_left:
+            compiler.sample(self.rule, state)
+        return self.rule.evaluate(state, compiler)
+
+    def is_cached(self, state: CollectionState) -> bool:
+        """Whether the rule already has a result for the state, for the rule profiler."""
+        rule = self.rule
+        return rule.cacheable and get_state_versions(state, self.player).get(rule.version_key) in rule.results
+
+    def __getstate__(self):
+        return self.rule, self.player
+
+    def __setstate__(self, state):
+        self.rule, self.player = state
+        self.compiler = None
+
+class BatchRequiresRule(RequiresRule):
+    """Access rule reading its compiled rule from the batch result of the state, see BatchRules.py."""
+    __slots__ = ()
+
+    def __call__(self, state: CollectionState) -> bool:
+        compiler = self.compiler
+        if compiler is None:
+            compiler = self.compiler = state.multiworld.worlds[self.player].rule_compiler
+        return compiler.world.batch_rules.check(state, self.rule)
+
+    def is_cached(self, state: CollectionState) -> bool:
+        return get_state_versions(state, self.player).get(state_version_key) in state.multiworld.worlds[self.player].batch_rules.results
+
+class ShadowRules:
+    """Cross-checks a sample of the compiled access rules against the legacy checkers, installed when enable_shadow_rules is set in meta.json.
+    The sample is every shadow_rules_sample-th call of each rule, counted per rule so it doesn't depend on the world's random."""
+
+    def __init__(self, player: int, sample: int):
+        self.player = player
+        self.sample = max(sample, 1)
+        self.checked = 0
+        self.mismatches = 0
+
+    def wrap(self, rule: Callable[[CollectionState], bool], compiled: CompiledRule, area: dict, area_name: str) -> "ShadowRule":
+        return ShadowRule(rule, compiled, area, area_name, self)
+
+    def check(self, rule: "ShadowRule", state: CollectionState, result: bool):
+        world = state.multiworld.worlds[self.player]
+        self.checked += 1
+        legacy = legacyLocationOrRegionCheck(world, state.multiworld, state, self.player, rule.area)
+        if legacy != result:
+            self.mismatches += 1
+            read_items = sorted({name for node in walk(rule.compiled) for name in node.dependencies()})
+            counts = ", ".join(f"{name}: {state.count(name, self.player)}" for name in read_items if state.count(name, self.player))
+            logging.warning(f"{world.game} rule of {rule.area_name} for player {self.player} is {result} but the legacy check is {legacy}: "
+                            f"requires {rule.area['requires']!r}, compiled as {rule.compiled!r}, with {{{counts}}}")
+
+    def summary(self) -> str:
+        return f"{self.checked} access rule calls cross-checked against the legacy checkers, {self.mismatches} mismatches"
+
+class ShadowRule:
+    """Access rule answering with the compiled rule, and also running the legacy checker on the sampled calls."""
+    __slots__ = ("rule", "compiled", "area", "area_name", "shadow", "calls")
+
+    def __init__(self, rule: Callable[[CollectionState], bool], compiled: CompiledRule, area: dict, area_name: str, shadow: ShadowRules):
+        self.rule = rule
+        self.compiled = compiled
+        self.area = area
+        self.area_name = area_name
+        self.shadow = shadow
+        self.calls = 0
+
+    def __call__(self, state: CollectionState) -> bool:
+        result = self.rule(state)
+        calls = self.calls
+        self.calls = calls + 1
+        if not calls % self.shadow.sample:
+            self.shadow.check(self, state, result)
+        return result
+
+    def is_cached(self, state: CollectionState) -> bool:
+        return self.rule.is_cached(state)
+
+class VictoryRule:
+    __slots__ = ("player",)
+
+    def __init__(self, player: int):
+        self.player = player
+
+    def __call__(self, state: CollectionState) -> bool:
+        return state.has("__Victory__", self.player)
+
+class ForbiddenItemsRule:
+    """Item rule of the locations with dont_place_item(_category), keeping those items of the player out of them.
+    rule is the item rule the location had before, if any."""
+    __slots__ = ("items", "player", "rule")
+
+    def __init__(self, items: frozenset[str], player: int, rule: Optional[Callable[[Item], bool]]):
+        self.items = items
+        self.player = player
+        self.rule = rule
+
+    def __call__(self, item: Item) -> bool:
+        if item.player == self.player and item.name in self.items:
+            return False
+        return self.rule is None or self.rule(item)
+
+def allAccessible(state: CollectionState):
+    return True
 
-    # handle any type of checking needed, then ferry the check off to a dedicated method for that check
-    def fullLocationOrRegionCheck(state: CollectionState, area: dict):
+def set_rules(world: "ManualWorld", multiworld: MultiWorld, player: int):
+    # every requires string is parsed once here, the access rules then only evaluate the compiled expression
+    compiler = RuleCompiler(world)
+    world.rule_compiler = compiler
+
+    batch = None
+    if enable_batch_rules:
+        if numpy_loaded:
+            batch = BatchRules(compiler)
+        else:
+            logging.warning(f"{world.game} has enable_batch_rules in its meta.json but numpy isn't installed, using the compiled rules instead.")
+    world.batch_rules = batch
+
+    profiler = RuleProfiler() if enable_rule_profiler else None
+    world.rule_profiler = profiler
+
+    shadow = ShadowRules(player, shadow_rules_sample) if enable_shadow_rules else None
+    world.shadow_rules = shadow
+
+    # handle any type of checking needed, then compile the check into a rule that only needs the state
+    def compileLocationOrRegionCheck(area: dict, area_name: str) -> Callable[[CollectionState], bool]:
         # if it's not a usable object of some sort, default to true
         if not area:
-            return True
+            return allAccessible
 
         # don't require the "requires" key for locations and regions if they don't need to use it
         if "requires" not in area.keys():
-            return True
-
-        if isinstance(area["requires"], str):
-            return checkRequireStringForArea(state, area)
-        else:  # item access is in dict form
-            return checkRequireDictForArea(state, area)
-
-    used_location_names = []
-    # Region access rules
-    for region in regionMap.keys():
-        used_location_names.extend([l.name for l in multiworld.get_region(region, player).locations])
-        if region != "Menu":
-            for exitRegion in multiworld.get_region(region, player).exits:
-                def fullRegionCheck(state: CollectionState, region=regionMap[region]):
-                    return fullLocationOrRegionCheck(state, region)
-
-                set_rule(multiworld.get_entrance(exitRegion.name, player), fullRegionCheck)
-
-    # Location access rules
-    for location in world.location_table:
-        if location["name"] not in used_location_names:
-            continue
-
-        locFromWorld = multiworld.get_location(location["name"], player)
-
-        locationRegion = regionMap[location["region"]] if "region" in location else None
-
-        if "requires" in location: # Location has requires, check them alongside the region requires
-            def checkBothLocationAndRegion(state: CollectionState, location=location, region=locationRegion):
-                locationCheck = fullLocationOrRegionCheck(state, location)
-                regionCheck = True # default to true unless there's a region with requires
-
-                if region:
-                    regionCheck = fullLocationOrRegionCheck(state, region)
-
-                return locationCheck and regionCheck
-
-            set_rule(locFromWorld, checkBothLocationAndRegion)
-        elif "region" in location: # Only region access required, check the location's region's requires
-            def fullRegionCheck(state, region=locationRegion):
-                return fullLocationOrRegionCheck(state, region)
-
-            set_rule(locFromWorld, fullRegionCheck)
-        else: # No location region and no location requires? It's accessible.
-            def allRegionsAccessible(state):
-                return True
-
-            set_rule(locFromWorld, allRegionsAccessible)
+            return allAccessible
+
+        # areas with the same requires, in string or dict form, share the same compiled rule and so its cached results
+        rule = compiler.compile_rule(area["requires"], area_name)
+
+        if batch is not None:
+            batch.add_area(area_name, rule)
+            check = BatchRequiresRule(rule, player)
+        else:
+            check = RequiresRule(rule, player)
+
+        # only wrapped when profiling, so the rules don't pay for the counters otherwise
+        if profiler is not None:
+            check = profiler.wrap(check, area_name)
+        # the legacy checks run outside of the profiled rule so they don't count in its time
+        if shadow is not None:
+            check = shadow.wrap(check, rule, area, area_name)
+        return check
+
+    # Each region of the world is visited once, and its entrances and locations are set from their objects directly
+    for region, regionData in regionMap.items():
+        regionFromWorld = multiworld.get_region(region, player)
+
+        # Region access rules
+        # A region's requires are only checked on the entrances into it: AP caches which regions are reachable for each state,
+        # so the locations and exits of the region don't need to check them again.
+        regionCheck = compileLocationOrRegionCheck(regionData, region)
+        for entrance in regionFromWorld.entrances:
+            set_rule(entrance, regionCheck)
+
+        # Location access rules
+        for locFromWorld in regionFromWorld.locations:
+            location = location_name_to_location.get(locFromWorld.name)
+            if location is None: # not one of ours, a hook may have added it with its own rule
+                continue
+
+            if "requires" in location: # Location has requires, its region's requires are already checked by the region's entrances
+                set_rule(locFromWorld, compileLocationOrRegionCheck(location, location["name"]))
+            else: # No location requires? It's accessible as soon as its region is.
+                set_rule(locFromWorld, allAccessible)
+
+    compiler.share_common_subexpressions()
+
+    # Collecting or removing an item only invalidates the cached results of the rules reading it
+    compiler.index_dependencies()
+
+    # the dump lists every compiled rule, only build it when it's logged
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"{world.game} rules for player {player}: {compiler.dump()}")
 
     # Victory requirement
-    multiworld.completion_condition[player] = lambda state: state.has("__Victory__", player)
+    multiworld.completion_condition[player] = VictoryRule(player)
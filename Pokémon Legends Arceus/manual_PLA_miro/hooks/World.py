@@ -4,6 +4,7 @@ from BaseClasses import MultiWorld, CollectionState
 
 # Object classes from Manual -- extending AP core -- representing items and locations that are used in generation
 from ..Items import ManualItem
+from ..ItemPool import ItemPool
 from ..Locations import ManualLocation
 
 # Raw JSON data from the Manual apworld, respectively:
@@ -12,7 +13,7 @@ from ..Locations import ManualLocation
 from ..Data import game_table, item_table, location_table, region_table
 
 # These helper methods allow you to determine if an option has been set, or what its value is, for any player in the multiworld
-from ..Helpers import is_option_enabled, get_option_value
+from ..Helpers import is_option_enabled, get_option_value, passthrough
 
 # calling logging.info("message") anywhere below in this file will output the message to both console and log file
 import logging
@@ -71,7 +72,11 @@ def after_create_regions(world: World, multiworld: MultiWorld, player: int):
         multiworld.clear_location_cache()
 
 # The item pool before starting items are processed, in case you want to see the raw item pool at that stage
-def before_create_items_starting(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+# The item pools given to the create_items hooks are an ItemPool (see ItemPool.py) rather than a list. It supports the list
+# operations (indexing, len, iteration, append, extend, remove, sort...) and also item_pool.take("Item Name"),
+# item_pool.take_many(names), item_pool.precollect(names) and item_pool.remove_category("Category"), which find the items by name.
+# It isn't a list subclass, so use list(item_pool) where an actual list is needed. Returning a list is fine too.
+def before_create_items_starting(item_pool: ItemPool, world: World, multiworld: MultiWorld, player: int) -> ItemPool:
 
     #Start inventory:
     start_inventory_items = []
@@ -98,15 +103,12 @@ def before_create_items_starting(item_pool: list, world: World, multiworld: Mult
     start_inventory_items += [progressive_poke_balls[0]]
 
     #logging.info(f"start_inventory_items: {start_inventory_items}")
-    for itemName in start_inventory_items: #precollect items, then delete from item pool.
-        start_inventory = next(item for item in item_pool if item.name == itemName)
-        multiworld.push_precollected(start_inventory)
-        item_pool.remove(start_inventory)
+    item_pool.precollect(start_inventory_items) #precollect items, then delete from item pool.
 
     return item_pool
 
-# The item pool after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
-def before_create_items_filler(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+# The item pool (an ItemPool, see before_create_items_starting) after starting items are processed but before filler is added, in case you want to see the raw item pool at that stage
+def before_create_items_filler(item_pool: ItemPool, world: World, multiworld: MultiWorld, player: int) -> ItemPool:
 
     itemNamesToRemove = [] # List of item names
     locationNamesToRemove = ["Repair Odd Keystone with 1 wisp", "Repair Odd Keystone with 2 wisps", "Repair Odd Keystone with 3 wisps", "Repair Odd Keystone with 4 wisps", "Repair Odd Keystone with 5 wisps", "Repair Odd Keystone with 6 wisps", "Repair Odd Keystone with 7 wisps", "Repair Odd Keystone with 8 wisps", "Repair Odd Keystone with 9 wisps", "Repair Odd Keystone with 10 wisps", "Repair Odd Keystone with 11 wisps", "Repair Odd Keystone with 12 wisps", "Repair Odd Keystone with 13 wisps", "Repair Odd Keystone with 14 wisps", "Repair Odd Keystone with 15 wisps", "Repair Odd Keystone with 16 wisps", "Repair Odd Keystone with 17 wisps", "Repair Odd Keystone with 18 wisps", "Repair Odd Keystone with 19 wisps", "Repair Odd Keystone with 20 wisps", "Repair Odd Keystone with 21 wisps", "Repair Odd Keystone with 22 wisps", "Repair Odd Keystone with 23 wisps", "Repair Odd Keystone with 24 wisps", "Repair Odd Keystone with 25 wisps", "Repair Odd Keystone with 26 wisps", "Repair Odd Keystone with 27 wisps", "Repair Odd Keystone with 28 wisps", "Repair Odd Keystone with 29 wisps", "Repair Odd Keystone with 30 wisps", "Repair Odd Keystone with 31 wisps", "Repair Odd Keystone with 32 wisps", "Repair Odd Keystone with 33 wisps", "Repair Odd Keystone with 34 wisps", "Repair Odd Keystone with 35 wisps", "Repair Odd Keystone with 36 wisps", "Repair Odd Keystone with 37 wisps", "Repair Odd Keystone with 38 wisps", "Repair Odd Keystone with 39 wisps", "Repair Odd Keystone with 40 wisps", "Repair Odd Keystone with 41 wisps", "Repair Odd Keystone with 42 wisps", "Repair Odd Keystone with 43 wisps", "Repair Odd Keystone with 44 wisps", "Repair Odd Keystone with 45 wisps", "Repair Odd Keystone with 46 wisps", "Repair Odd Keystone with 47 wisps", "Repair Odd Keystone with 48 wisps", "Repair Odd Keystone with 49 wisps", "Repair Odd Keystone with 50 wisps", "Repair Odd Keystone with 51 wisps", "Repair Odd Keystone with 52 wisps", "Repair Odd Keystone with 53 wisps", "Repair Odd Keystone with 54 wisps", "Repair Odd Keystone with 55 wisps", "Repair Odd Keystone with 56 wisps", "Repair Odd Keystone with 57 wisps", "Repair Odd Keystone with 58 wisps", "Repair Odd Keystone with 59 wisps", "Repair Odd Keystone with 60 wisps", "Repair Odd Keystone with 61 wisps", "Repair Odd Keystone with 62 wisps", "Repair Odd Keystone with 63 wisps", "Repair Odd Keystone with 64 wisps", "Repair Odd Keystone with 65 wisps", "Repair Odd Keystone with 66 wisps", "Repair Odd Keystone with 67 wisps", "Repair Odd Keystone with 68 wisps", "Repair Odd Keystone with 69 wisps", "Repair Odd Keystone with 70 wisps", "Repair Odd Keystone with 71 wisps", "Repair Odd Keystone with 72 wisps", "Repair Odd Keystone with 73 wisps", "Repair Odd Keystone with 74 wisps", "Repair Odd Keystone with 75 wisps", "Repair Odd Keystone with 76 wisps", "Repair Odd Keystone with 77 wisps", "Repair Odd Keystone with 78 wisps", "Repair Odd Keystone with 79 wisps", "Repair Odd Keystone with 80 wisps", "Repair Odd Keystone with 81 wisps", "Repair Odd Keystone with 82 wisps", "Repair Odd Keystone with 83 wisps", "Repair Odd Keystone with 84 wisps", "Repair Odd Keystone with 85 wisps", "Repair Odd Keystone with 86 wisps", "Repair Odd Keystone with 87 wisps", "Repair Odd Keystone with 88 wisps", "Repair Odd Keystone with 89 wisps", "Repair Odd Keystone with 90 wisps", "Repair Odd Keystone with 91 wisps", "Repair Odd Keystone with 92 wisps", "Repair Odd Keystone with 93 wisps", "Repair Odd Keystone with 94 wisps", "Repair Odd Keystone with 95 wisps", "Repair Odd Keystone with 96 wisps", "Repair Odd Keystone with 97 wisps", "Repair Odd Keystone with 98 wisps", "Repair Odd Keystone with 99 wisps", "Repair Odd Keystone with 100 wisps", "Repair Odd Keystone with 101 wisps", "Repair Odd Keystone with 102 wisps", "Repair Odd Keystone with 103 wisps", "Repair Odd Keystone with 104 wisps", "Repair Odd Keystone with 105 wisps", "Repair Odd Keystone with 106 wisps", "Repair Odd Keystone with 107 wisps", "Repair Odd Keystone with 108 wisps"] # List of location names
@@ -155,10 +157,8 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
         #logging.info(f'precollect_items: {precollect_items}')
         for itemName in precollect_items: #precollect items, then delete from item pool. Some are already in start_inventory, so try/continue.
             try:
-                start_inventory = next(item for item in item_pool if item.name == itemName)
-                multiworld.push_precollected(start_inventory)
-                item_pool.remove(start_inventory)
-            except StopIteration:
+                item_pool.precollect([itemName])
+            except KeyError:
                 continue
         spare_locations += 14
     if spare_locations < 9:
@@ -167,10 +167,7 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
         precollect_items += world.item_name_groups["outbreak"]
         precollect_items += world.item_name_groups["Ride Pokémon"]
         #logging.info(f'precollect_items 2: {precollect_items}')
-        for itemName in precollect_items:
-            start_inventory = next(item for item in item_pool if item.name == itemName)
-            multiworld.push_precollected(start_inventory)
-            item_pool.remove(start_inventory)
+        item_pool.precollect(precollect_items)
         spare_locations += 15
 
     #logging.info(f'location_count: {location_count}')
@@ -208,9 +205,7 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
 
     #print(itemNamesToRemove)
 
-    for itemName in itemNamesToRemove:
-        item = next(i for i in item_pool if i.name == itemName)
-        item_pool.remove(item)
+    item_pool.take_many(itemNamesToRemove)
 
     #print(item_pool)
 
@@ -220,12 +215,11 @@ def before_create_items_filler(item_pool: list, world: World, multiworld: MultiW
 
     ## Place an item at a specific location
     # location = next(l for l in multiworld.get_unfilled_locations(player=player) if l.name == "Location Name")
-    # item_to_place = next(i for i in item_pool if i.name == "Item Name")
+    # item_to_place = item_pool.take("Item Name")
     # location.place_locked_item(item_to_place)
-    # item_pool.remove(item_to_place)
 
-# The complete item pool prior to being set for generation is provided here, in case you want to make changes to it
-def after_create_items(item_pool: list, world: World, multiworld: MultiWorld, player: int) -> list:
+# The complete item pool (an ItemPool, see before_create_items_starting) prior to being set for generation is provided here, in case you want to make changes to it
+def after_create_items(item_pool: ItemPool, world: World, multiworld: MultiWorld, player: int) -> ItemPool:
     return item_pool
 
 # Called before rules for accessing regions and locations are created. Not clear why you'd want this, but it's here.
@@ -252,11 +246,13 @@ def after_set_rules(world: World, multiworld: MultiWorld, player: int):
     # OR
     # location.access_rule = lambda state: old_rule(state) or Example_Rule(state)
 
-# The item name to create is provided before the item is created, in case you want to make changes to it
+# The item name to create is provided before the item is created, in case you want to make changes to it (and remove @passthrough when you do)
+@passthrough
 def before_create_item(item_name: str, world: World, multiworld: MultiWorld, player: int) -> str:
     return item_name
 
-# The item that was created is provided after creation, in case you want to modify the item
+# The item that was created is provided after creation, in case you want to modify the item (and remove @passthrough when you do)
+@passthrough
 def after_create_item(item: ManualItem, world: World, multiworld: MultiWorld, player: int) -> ManualItem:
     return item
 